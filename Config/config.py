@@ -5,40 +5,85 @@ Reads configuration from environment variables for security
 
 import os
 from dotenv import load_dotenv
-# Load environment variables from .env file
-load_dotenv()
+
+# Load environment variables from .env file - only when they aren't already injected
+# (App Service / containers set them directly, so parsing .env there is wasted startup work)
+if not os.getenv("AZURE_OPENAI_API_KEY"):
+    load_dotenv()
+
+# Read every setting once at import - constants below are references into this map
+_CONFIG = {key: os.getenv(key, default) for key, default in (
+    # Azure OpenAI Configuration
+    ("AZURE_OPENAI_API_KEY", None),
+    ("AZURE_OPENAI_ENDPOINT", None),
+    ("AZURE_OPENAI_API_VERSION", "2023-05-15"),
+    ("AZURE_OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002"),
+    ("AZURE_OPENAI_CHAT_COMPLETION_MODEL", "gpt-4.1"),
+    ("OPENAI_KEEPALIVE_INTERVAL", "0"),
+    ("OPENAI_MAX_CONNECTIONS", "128"),
+    ("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "64"),
+    ("EMBEDDING_BATCH_WINDOW_MS", "8"),
+    ("EMBEDDING_BATCH_MAX_SIZE", "32"),
+    # Azure Search Configuration
+    ("SEARCH_SERVICE_NAME", None),
+    ("SEARCH_API_KEY", None),
+    ("INDEX_NAME", "moodle-index-1"),
+    ("SEARCH_MAX_CONNECTIONS", "64"),
+    # Azure Storage Configuration
+    ("STORAGE_CONNECTION_STRING", None),
+    ("CONTAINER_NAME", "processeddata"),
+    ("MAX_BLOB_CONCURRENCY", "32"),
+)}
+
+
+def get_config(key: str, default=None):
+    """Get a setting from the cached config map (use instead of os.getenv at runtime)"""
+    value = _CONFIG.get(key)
+    return default if value is None else value
+
 
 # Azure OpenAI Configuration
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2023-05-15")
-AZURE_OPENAI_EMBEDDING_MODEL = os.getenv("AZURE_OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
-AZURE_OPENAI_CHAT_COMPLETION_MODEL = os.getenv("AZURE_OPENAI_CHAT_COMPLETION_MODEL", "gpt-4.1")
+AZURE_OPENAI_API_KEY = _CONFIG["AZURE_OPENAI_API_KEY"]
+AZURE_OPENAI_ENDPOINT = _CONFIG["AZURE_OPENAI_ENDPOINT"]
+AZURE_OPENAI_API_VERSION = _CONFIG["AZURE_OPENAI_API_VERSION"]
+AZURE_OPENAI_EMBEDDING_MODEL = _CONFIG["AZURE_OPENAI_EMBEDDING_MODEL"]
+AZURE_OPENAI_CHAT_COMPLETION_MODEL = _CONFIG["AZURE_OPENAI_CHAT_COMPLETION_MODEL"]
+# Seconds between keep-alive pings that keep idle OpenAI connections warm (0 = disabled)
+OPENAI_KEEPALIVE_INTERVAL = float(_CONFIG["OPENAI_KEEPALIVE_INTERVAL"])
+# Shared OpenAI HTTP pool - max concurrent connections, and how many idle ones are kept open
+OPENAI_MAX_CONNECTIONS = int(_CONFIG["OPENAI_MAX_CONNECTIONS"])
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(_CONFIG["OPENAI_MAX_KEEPALIVE_CONNECTIONS"])
+# Query embedding micro-batching - how long a batch waits for more queries (ms), and max batch size
+EMBEDDING_BATCH_WINDOW_MS = float(_CONFIG["EMBEDDING_BATCH_WINDOW_MS"])
+EMBEDDING_BATCH_MAX_SIZE = int(_CONFIG["EMBEDDING_BATCH_MAX_SIZE"])
 
 # Azure Search Configuration
-SEARCH_SERVICE_NAME = os.getenv("SEARCH_SERVICE_NAME")
-SEARCH_API_KEY = os.getenv("SEARCH_API_KEY")
-INDEX_NAME = os.getenv("INDEX_NAME", "moodle-index-1")
+SEARCH_SERVICE_NAME = _CONFIG["SEARCH_SERVICE_NAME"]
+SEARCH_API_KEY = _CONFIG["SEARCH_API_KEY"]
+INDEX_NAME = _CONFIG["INDEX_NAME"]
+# Max concurrent connections in each search client's aiohttp pool
+SEARCH_MAX_CONNECTIONS = int(_CONFIG["SEARCH_MAX_CONNECTIONS"])
 
 # Azure Storage Configuration
-STORAGE_CONNECTION_STRING = os.getenv("STORAGE_CONNECTION_STRING")
-CONTAINER_NAME = os.getenv("CONTAINER_NAME", "processeddata")  # Default value if not set
+STORAGE_CONNECTION_STRING = _CONFIG["STORAGE_CONNECTION_STRING"]
+CONTAINER_NAME = _CONFIG["CONTAINER_NAME"]  # Default value if not set
+# Max concurrent blob operations - also sizes the shared aiohttp connection pool
+MAX_BLOB_CONCURRENCY = int(_CONFIG["MAX_BLOB_CONCURRENCY"])
+
+# Required settings for the Chat Service
+REQUIRED_VARS = (
+    "AZURE_OPENAI_API_KEY",
+    "AZURE_OPENAI_ENDPOINT",
+    "SEARCH_SERVICE_NAME",
+    "SEARCH_API_KEY",
+    "STORAGE_CONNECTION_STRING"
+)
+
 
 # Validation - ensure critical environment variables are set
 def validate_config():
     """Validate that all required environment variables are set for Chat Service"""
-    required_vars = [
-        "AZURE_OPENAI_API_KEY",
-        "AZURE_OPENAI_ENDPOINT",
-        "SEARCH_SERVICE_NAME",
-        "SEARCH_API_KEY",
-        "STORAGE_CONNECTION_STRING"
-    ]
-
-    missing_vars = []
-    for var in required_vars:
-        if not os.getenv(var):
-            missing_vars.append(var)
+    missing_vars = [var for var in REQUIRED_VARS if not _CONFIG[var]]
 
     if missing_vars:
         raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
@@ -47,4 +92,4 @@ def validate_config():
 
 # Optional: Run validation when module is imported
 # Uncomment the line below if you want automatic validation
-# validate_config()
+# validate_config()
\ No newline at end of file
@@ -1,34 +1,66 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+LOGGER_NAME = 'academic_api'
+
+# Correlation ID of the request being handled - set per request by main.RequestIdMiddleware,
+# inherited by the tasks it starts, and written on every log record ("-" outside a request)
+request_id_var: ContextVar[str] = ContextVar('request_id', default='-')
+
+# Formatters are immutable once built - create them once at import
+DETAILED_FORMATTER = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(funcName)s:%(lineno)d - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+SIMPLE_FORMATTER = logging.Formatter(
+    '%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request's correlation ID"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+# Memoized logger - set on the first setup_logging() call
+_LOGGER = None
 
-# Create logs directory if it doesn't exist
-if not os.path.exists('logs'):
-    os.makedirs('logs')
 
 # Configure comprehensive logging
 def setup_logging():
-    """Setup comprehensive logging with file rotation and multiple levels"""
+    """
+    Setup comprehensive logging with file rotation and multiple levels
+
+    The logger itself only gets a QueueHandler, so logging calls made from async
+    request paths are a cheap queue put. A background QueueListener thread does
+    the formatting and the actual file/console writes.
+    """
+    global _LOGGER
+    if _LOGGER is not None:
+        return _LOGGER
+
+    # Create logs directory if it doesn't exist
+    if not os.path.exists('logs'):
+        os.makedirs('logs')
 
     # Create logger
-    logger = logging.getLogger('academic_api')
+    logger = logging.getLogger(LOGGER_NAME)
     logger.setLevel(logging.DEBUG)
 
     # Prevent duplicate logs if logger already exists
     if logger.handlers:
+        _LOGGER = logger
         return logger
 
-    # Create formatters
-    detailed_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-
-    simple_formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-
     # File handler with rotation (max 10MB, keep 5 files)
     file_handler = RotatingFileHandler(
         'logs/academic_api.log',
@@ -37,7 +69,7 @@ def setup_logging():
         encoding='utf-8'
     )
     file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(detailed_formatter)
+    file_handler.setFormatter(DETAILED_FORMATTER)
 
     # Error file handler (only errors and critical)
     error_handler = RotatingFileHandler(
@@ -47,16 +79,31 @@ def setup_logging():
         encoding='utf-8'
     )
     error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(detailed_formatter)
+    error_handler.setFormatter(DETAILED_FORMATTER)
 
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(simple_formatter)
+    console_handler.setFormatter(SIMPLE_FORMATTER)
+
+    # Route records through a queue - the listener thread owns the real handlers
+    # (the ID is stamped here, in the logging task's context - the listener thread has none)
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(
+        log_queue,
+        file_handler,
+        error_handler,
+        console_handler,
+        respect_handler_level=True
+    )
+    listener.start()
 
-    # Add handlers to logger
-    logger.addHandler(file_handler)
-    logger.addHandler(error_handler)
-    logger.addHandler(console_handler)
+    # Flush pending records on interpreter exit
+    atexit.register(listener.stop)
 
-    return logger
\ No newline at end of file
+    _LOGGER = logger
+    return logger
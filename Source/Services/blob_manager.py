@@ -5,57 +5,117 @@ Supports all file types: MP4, MD, PDF, JSON etc.
 """
 
 import os
+import time
+import logging
 from typing import Optional, List
-from datetime import datetime, timedelta
-from azure.storage.blob import BlobServiceClient, ContentSettings, generate_blob_sas, BlobSasPermissions
+from datetime import datetime, timedelta, timezone
+from azure.storage.blob import ContentSettings, generate_blob_sas, BlobSasPermissions
 from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
-from Config.config import STORAGE_CONNECTION_STRING, CONTAINER_NAME
+from Config.config import STORAGE_CONNECTION_STRING, CONTAINER_NAME, MAX_BLOB_CONCURRENCY
+from Source.Services.shared_clients import build_aiohttp_transport
 import traceback
 import asyncio
-from Config.logging_config import setup_logging
-logger = setup_logging()
+from Config.logging_config import setup_logging, LOGGER_NAME
+logger = logging.getLogger(LOGGER_NAME)
+
+# Process-wide async client - every BlobManager shares its connection pool
+_ASYNC_CLIENT = None
+
+# Blob listing page size (the service maximum)
+BLOB_LIST_PAGE_SIZE = 5000
+
+# SAS expiries are rounded up to this window so repeated requests for the same
+# blob produce the same token and can be served from _SAS_CACHE
+SAS_BUCKET_SECONDS = 15 * 60
+SAS_CACHE_MAX_ENTRIES = 4096
+
+# (container, blob_name, hours, bucket) -> SAS URL
+_SAS_CACHE = {}
+
+# SAS validity durations, built once - other values are added on first use
+_HOURS_TO_DELTA = {1: timedelta(hours=1), 4: timedelta(hours=4), 24: timedelta(hours=24)}
+
+
+def get_async_client() -> AsyncBlobServiceClient:
+    """
+    Get the shared async Blob Service client, creating it on first use
+
+    Must be called with a running event loop (the aiohttp session binds to it).
+    Creation is synchronous (no await between the check and the assignment), so
+    concurrent callers on the event loop can't race into building two clients.
+    Never wrap operations in `async with` on this client - that closes the
+    shared transport for everyone.
+    """
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        _ASYNC_CLIENT = AsyncBlobServiceClient.from_connection_string(
+            STORAGE_CONNECTION_STRING,
+            # Default aiohttp pool is too small for fan-out downloads
+            transport=build_aiohttp_transport(
+                limit=MAX_BLOB_CONCURRENCY * 2,
+                limit_per_host=MAX_BLOB_CONCURRENCY
+            )
+        )
+        logger.info("Shared async Blob Service client created")
+    return _ASYNC_CLIENT
+
 
 class BlobManager:
     """Manages upload and download of files to Azure Blob Storage"""
 
+    # File type to content type mapping (lowercase extensions, built once per class)
+    content_types = {
+        '.mp4': 'video/mp4',
+        '.avi': 'video/x-msvideo',
+        '.mov': 'video/quicktime',
+        '.wmv': 'video/x-ms-wmv',
+        '.flv': 'video/x-flv',
+        '.webm': 'video/webm',
+        '.mkv': 'video/x-matroska',
+        '.md': 'text/markdown',
+        '.txt': 'text/plain',
+        '.pdf': 'application/pdf',
+        '.json': 'application/json',
+        '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        '.jpg': 'image/jpeg',
+        '.jpeg': 'image/jpeg',
+        '.png': 'image/png',
+        '.gif': 'image/gif',
+        '.bmp': 'image/bmp',
+        '.zip': 'application/zip',
+        '.rar': 'application/x-rar-compressed',
+        '.7z': 'application/x-7z-compressed'
+    }
+
     def __init__(self, container_name: str = None):
         # If no container_name is passed, use default from config
         self.container_name = container_name if container_name is not None else CONTAINER_NAME
 
-        # Initialize async client for reuse
-        self._async_client = AsyncBlobServiceClient.from_connection_string(STORAGE_CONNECTION_STRING)
-
-        # File type to content type mapping
-        # File type to content type mapping
-        self.content_types = {
-            '.mp4': 'video/mp4',
-            '.avi': 'video/x-msvideo',
-            '.mov': 'video/quicktime',
-            '.wmv': 'video/x-ms-wmv',
-            '.flv': 'video/x-flv',
-            '.webm': 'video/webm',
-            '.mkv': 'video/x-matroska',
-            '.md': 'text/markdown',
-            '.txt': 'text/plain',
-            '.pdf': 'application/pdf',
-            '.json': 'application/json',
-            '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.bmp': 'image/bmp',
-            '.zip': 'application/zip',
-            '.rar': 'application/x-rar-compressed',
-            '.7z': 'application/x-7z-compressed'
-        }
+        # Reference the shared async client (one connection pool per process)
+        self._async_client = get_async_client()
+
+        # Account details used for SAS generation - fixed for the client's lifetime
+        self._account_name = self._async_client.account_name
+        self._account_key = self._async_client.credential.account_key
+        self._primary_endpoint = self._async_client.primary_endpoint
+
+    @classmethod
+    async def close(cls):
+        """Close the shared async client - call once on application shutdown"""
+        global _ASYNC_CLIENT
+        if _ASYNC_CLIENT is not None:
+            client, _ASYNC_CLIENT = _ASYNC_CLIENT, None
+            await client.close()
+            logger.info("Shared async Blob Service client closed")
 
     def _get_content_type(self, file_path: str) -> str:
         """Determine content type based on file extension"""
-        _, ext = os.path.splitext(file_path.lower())
-        return self.content_types.get(ext, 'application/octet-stream')
+        _, dot, ext = file_path.rpartition('.')
+        if not dot:
+            return 'application/octet-stream'
+        return self.content_types.get('.' + ext.lower(), 'application/octet-stream')
 
     async def download_file(self, blob_name: str, local_file_path: str) -> bool:
         """
@@ -72,21 +132,26 @@ class BlobManager:
             container_client = self._async_client.get_container_client(self.container_name)
             blob_client = container_client.get_blob_client(blob_name)
 
-            logger.info(f"Downloading file: {blob_name} -> {local_file_path}")
+            logger.info("Downloading file: %s -> %s", blob_name, local_file_path)
 
-            stream = await blob_client.download_blob()
-            file_bytes = await stream.readall()
+            # Ranges are fetched in parallel into memory, then written to disk in a worker
+            # thread - file writes would otherwise block the event loop
+            stream = await blob_client.download_blob(max_concurrency=4)
+            content = await stream.readall()
+            await asyncio.to_thread(self._write_file, local_file_path, content)
 
-            with open(local_file_path, 'wb') as file_data:
-                file_data.write(file_bytes)
-
-            logger.info(f"File downloaded successfully: {local_file_path}")
+            logger.info("File downloaded successfully: %s", local_file_path)
             return True
 
         except Exception as e:
-            logger.info(f"Error downloading file {blob_name}: {e}")
+            logger.info("Error downloading file %s: %s", blob_name, e)
             return False
 
+    @staticmethod
+    def _write_file(local_file_path: str, content: bytes) -> None:
+        with open(local_file_path, 'wb') as file_data:
+            file_data.write(content)
+
     async def list_files(self, folder: Optional[str] = None) -> List[str]:
         """
         List files in blob storage (async)
@@ -103,63 +168,67 @@ class BlobManager:
             name_filter = f"{folder}/" if folder else ""
             blob_list = []
 
-            async for blob in container_client.list_blobs(name_starts_with=name_filter):
-                blob_list.append(blob.name)
+            # Names only (no BlobProperties parsing), consumed a whole service page at a time
+            pages = container_client.list_blob_names(
+                name_starts_with=name_filter, results_per_page=BLOB_LIST_PAGE_SIZE
+            ).by_page()
+            async for page in pages:
+                blob_list.extend([name async for name in page])
 
             return blob_list
 
         except Exception as e:
-            logger.info(f"Error listing files: {e}")
+            logger.info("Error listing files: %s", e)
             return []
 
-    # def download_folder_files(self, blob_folder_path: str, local_temp_dir: str) -> List[str]:
-    #     """
-    #     הורדת כל הקבצים מתיקייה ב-blob storage לתיקייה מקומית זמנית
-    #
-    #     Args:
-    #         blob_folder_path: נתיב התיקייה ב-blob storage (למשל: "Raw-data/Docs")
-    #         local_temp_dir: תיקייה מקומית זמנית לשמירת הקבצים
-    #
-    #     Returns:
-    #         רשימת נתיבי הקבצים המקומיים שהורדו
-    #     """
-    #     try:
-    #         container_client = self.blob_service.get_container_client(self.container_name)
-    #
-    #         # יצירת התיקייה המקומית אם לא קיימת
-    #         os.makedirs(local_temp_dir, exist_ok=True)
-    #
-    #         downloaded_files = []
-    #
-    #         logger.info(f"מוריד קבצים מ-blob: {blob_folder_path}")
-    #
-    #         # רשימת כל הקבצים בתיקייה
-    #         blob_list = container_client.list_blobs(name_starts_with=blob_folder_path)
-    #
-    #         for blob in blob_list:
-    #             # דילוג על תיקיות (שמות שמסתיימים ב-/)
-    #             if blob.name.endswith('/'):
-    #                 continue
-    #
-    #             # קבלת שם הקובץ בלבד (ללא הנתיב המלא)
-    #             filename = os.path.basename(blob.name)
-    #             local_file_path = os.path.join(local_temp_dir, filename)
-    #
-    #             logger.info(f"מוריד: {blob.name} → {local_file_path}")
-    #
-    #             # הורדת הקובץ
-    #             blob_client = container_client.get_blob_client(blob.name)
-    #             with open(local_file_path, "wb") as download_file:
-    #                 download_file.write(blob_client.download_blob().readall())
-    #
-    #             downloaded_files.append(local_file_path)
-    #
-    #         logger.info(f"הורדו {len(downloaded_files)} קבצים מ-blob storage")
-    #         return downloaded_files
-    #
-    #     except Exception as e:
-    #         logger.info(f"שגיאה בהורדת קבצים מ-blob storage: {e}")
-    #         return []
+    async def download_folder_files(self, blob_folder_path: str, local_temp_dir: str) -> List[str]:
+        """
+        Download all files from a blob storage folder to a local temp folder (async)
+
+        Downloads run concurrently, bounded by MAX_BLOB_CONCURRENCY so they fit
+        the shared connection pool.
+
+        Args:
+            blob_folder_path: Folder path in blob storage (e.g. "Raw-data/Docs")
+            local_temp_dir: Local temp folder to save the files into
+
+        Returns:
+            List of local file paths that were downloaded
+        """
+        try:
+            container_client = self._async_client.get_container_client(self.container_name)
+
+            # Create the local folder if it doesn't exist
+            os.makedirs(local_temp_dir, exist_ok=True)
+
+            logger.info("Downloading files from blob folder: %s", blob_folder_path)
+
+            # Collect blob names first, skipping folder placeholders (names ending with /)
+            blob_names = []
+            pages = container_client.list_blob_names(
+                name_starts_with=blob_folder_path, results_per_page=BLOB_LIST_PAGE_SIZE
+            ).by_page()
+            async for page in pages:
+                blob_names.extend([name async for name in page if not name.endswith('/')])
+
+            semaphore = asyncio.Semaphore(MAX_BLOB_CONCURRENCY)
+
+            async def _download(blob_name: str) -> Optional[str]:
+                local_file_path = os.path.join(local_temp_dir, os.path.basename(blob_name))
+                async with semaphore:
+                    success = await self.download_file(blob_name, local_file_path)
+                return local_file_path if success else None
+
+            results = await asyncio.gather(*[_download(name) for name in blob_names], return_exceptions=True)
+
+            downloaded_files = [path for path in results if isinstance(path, str)]
+
+            logger.info("Downloaded %s of %s files from blob storage", len(downloaded_files), len(blob_names))
+            return downloaded_files
+
+        except Exception as e:
+            logger.info("Error downloading files from blob storage: %s", e)
+            return []
 
     async def generate_sas_url(self, blob_name: str, hours: int = 4) -> str:
         """
@@ -173,24 +242,40 @@ class BlobManager:
             SAS URL for the file
         """
         try:
+            # Expiry is rounded up to the next bucket boundary, so the token stays valid for
+            # at least `hours` and every request in the same window maps to the same token
+            bucket = int(time.time() // SAS_BUCKET_SECONDS) + 1
+            cache_key = (self.container_name, blob_name, hours, bucket)
+
+            blob_url = _SAS_CACHE.get(cache_key)
+            if blob_url is not None:
+                return blob_url
+
+            validity = _HOURS_TO_DELTA.get(hours) or _HOURS_TO_DELTA.setdefault(hours, timedelta(hours=hours))
+
             # Generate SAS token
             sas_token = generate_blob_sas(
-                account_name=self._async_client.account_name,
+                account_name=self._account_name,
                 container_name=self.container_name,
                 blob_name=blob_name,
-                account_key=self._async_client.credential.account_key,
+                account_key=self._account_key,
                 permission=BlobSasPermissions(read=True),
-                expiry=datetime.utcnow() + timedelta(hours=hours)
+                expiry=datetime.fromtimestamp(bucket * SAS_BUCKET_SECONDS, timezone.utc) + validity
             )
 
             # Create full URL
-            blob_url = f"{self._async_client.primary_endpoint}{self.container_name}/{blob_name}?{sas_token}"
+            blob_url = f"{self._primary_endpoint}{self.container_name}/{blob_name}?{sas_token}"
 
-            logger.info(f"Generated SAS URL for file: {blob_name} (valid for {hours} hours)")
+            # Entries from past windows are never hit again - drop them all when the cache fills up
+            if len(_SAS_CACHE) >= SAS_CACHE_MAX_ENTRIES:
+                _SAS_CACHE.clear()
+            _SAS_CACHE[cache_key] = blob_url
+
+            logger.info("Generated SAS URL for file: %s (valid for %s hours)", blob_name, hours)
             return blob_url
 
         except Exception as e:
-            logger.info(f"Error generating SAS URL for {blob_name}: {e}")
+            logger.info("Error generating SAS URL for %s: %s", blob_name, e)
             return ""
 
     async def download_to_memory(self, blob_name: str) -> Optional[bytes]:
@@ -207,16 +292,16 @@ class BlobManager:
             container_client = self._async_client.get_container_client(self.container_name)
             blob_client = container_client.get_blob_client(blob_name)
 
-            logger.info(f"Downloading file to memory: {blob_name}")
+            logger.info("Downloading file to memory: %s", blob_name)
 
             stream = await blob_client.download_blob()
             file_bytes = await stream.readall()
 
-            logger.info(f"File downloaded successfully to memory: {blob_name} ({len(file_bytes)} bytes)")
+            logger.info("File downloaded successfully to memory: %s (%s bytes)", blob_name, len(file_bytes))
             return file_bytes
 
         except Exception as e:
-            logger.info(f"Error downloading file to memory {blob_name}: {e}")
+            logger.info("Error downloading file to memory %s: %s", blob_name, e)
             return None
 
     async def upload_text_to_blob(self, text_content: str, blob_name: str, container: str = None) -> bool:
@@ -240,7 +325,7 @@ class BlobManager:
 
             container_client = self._async_client.get_container_client(target_container)
 
-            logger.info(f"Uploading text to blob: {target_container}/{blob_name}")
+            logger.info("Uploading text to blob: %s/%s", target_container, blob_name)
 
             # Direct text upload
             await container_client.upload_blob(
@@ -250,15 +335,16 @@ class BlobManager:
                 content_settings=ContentSettings(content_type=content_type)
             )
 
-            logger.info(f"Text uploaded successfully: {target_container}/{blob_name}")
+            logger.info("Text uploaded successfully: %s/%s", target_container, blob_name)
             return True
 
         except Exception as e:
-            logger.info(f"Error uploading text to blob: {e}")
+            logger.info("Error uploading text to blob: %s", e)
             return False
 
 async def main():
     """Test the blob manager with async functions"""
+    setup_logging()
     logger.info("Testing Blob Manager - Course Container")
     logger.info("=" * 50)
 
@@ -268,17 +354,17 @@ async def main():
         # Check Section1 folder specifically
         logger.info("\nFiles in 'Section1' folder:")
         section1_blobs = await blob_manager.list_files("Section1")
-        logger.info(f"Found {len(section1_blobs)} files in Section1:")
+        logger.info("Found %s files in Section1:", len(section1_blobs))
         for blob in section1_blobs:
-            logger.info(f"  - {blob}")
+            logger.info("  - %s", blob)
 
         logger.info("\nAll files in container:")
         all_blobs = await blob_manager.list_files()
-        logger.info(f"Total found {len(all_blobs)} files:")
+        logger.info("Total found %s files:", len(all_blobs))
         for blob in all_blobs[:10]:  # Show first 10
-            logger.info(f"  - {blob}")
+            logger.info("  - %s", blob)
         if len(all_blobs) > 10:
-            logger.info(f"  ... and {len(all_blobs) - 10} more files")
+            logger.info("  ... and %s more files", len(all_blobs) - 10)
 
         # Test uploading text content
         logger.info("\nTesting text upload to Section1 folder:")
@@ -292,12 +378,14 @@ async def main():
             logger.info("\nFiles in Section1 after upload:")
             updated_blobs = await blob_manager.list_files("Section1")
             for blob in updated_blobs:
-                logger.info(f"  - {blob}")
+                logger.info("  - %s", blob)
 
         logger.info("\nBlob manager test completed!")
 
+        await BlobManager.close()
+
     except Exception as e:
-        logger.info(f"Failed to test blob manager: {e}")
+        logger.info("Failed to test blob manager: %s", e)
         traceback.print_exc()
 
 if __name__ == "__main__":
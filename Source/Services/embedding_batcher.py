@@ -0,0 +1,103 @@
+"""
+Embedding Batcher - micro-batching for query embeddings
+Coalesces embedding requests that arrive within a short window (e.g. from
+concurrent chat requests) into one embeddings API call
+"""
+
+import asyncio
+import logging
+import weakref
+from typing import List, Optional, Set, Tuple
+from openai import AsyncAzureOpenAI
+from Config.config import AZURE_OPENAI_EMBEDDING_MODEL, EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_BATCH_MAX_SIZE
+from Config.logging_config import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# How long the first request of a batch waits for others to join (seconds)
+EMBEDDING_BATCH_WINDOW = EMBEDDING_BATCH_WINDOW_MS / 1000
+
+# One batcher per OpenAI client - services sharing a client also share its batches
+_BATCHERS: "weakref.WeakKeyDictionary[AsyncAzureOpenAI, EmbeddingBatcher]" = weakref.WeakKeyDictionary()
+
+
+def get_embedding_batcher(openai_client: AsyncAzureOpenAI) -> "EmbeddingBatcher":
+    """Get the shared batcher for an OpenAI client, creating it on first use"""
+    batcher = _BATCHERS.get(openai_client)
+    if batcher is None:
+        batcher = _BATCHERS[openai_client] = EmbeddingBatcher(openai_client)
+    return batcher
+
+
+class EmbeddingBatcher:
+    """
+    Batches concurrent single-text embedding requests
+
+    embed() queues the text and waits for its vector. A worker task collects queued
+    texts for up to `window` seconds (or until `max_batch_size`), sends them in one
+    embeddings request and resolves every waiter. Batches are dispatched as separate
+    tasks, so a slow API call doesn't hold back the next batch. The worker exits when
+    the queue is empty and is restarted by the next embed() call.
+    """
+
+    def __init__(self, openai_client: AsyncAzureOpenAI, model: str = AZURE_OPENAI_EMBEDDING_MODEL,
+                 window: float = EMBEDDING_BATCH_WINDOW, max_batch_size: int = EMBEDDING_BATCH_MAX_SIZE):
+        self.openai_client = openai_client
+        self.model = model
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Strong references to in-flight batch requests (the loop only keeps weak ones)
+        self._batch_tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> List[float]:
+        """Get the embedding of one text - raises if its batch request failed"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._collect_batches())
+
+        future = loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _collect_batches(self):
+        """Group queued requests into batches until the queue runs dry"""
+        loop = asyncio.get_running_loop()
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait()]
+            deadline = loop.time() + self.window
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Skip requests whose callers were cancelled while waiting
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if batch:
+                task = loop.create_task(self._embed_batch(batch))
+                self._batch_tasks.add(task)
+                task.add_done_callback(self._batch_tasks.discard)
+
+    async def _embed_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Send one embeddings request for a batch and resolve its futures"""
+        try:
+            response = await self.openai_client.embeddings.create(
+                model=self.model,
+                input=[text for text, _ in batch]
+            )
+            logger.debug("Embedded a batch of %d queries", len(batch))
+            # response.data is in input order
+            for (_, future), item in zip(batch, response.data):
+                if not future.done():
+                    future.set_result(item.embedding)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
@@ -19,21 +19,117 @@ Query Response Fields:
 
 import logging
 import asyncio
-from typing import List, Dict, Optional
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+import numpy as np
 from openai import AsyncAzureOpenAI
 from datetime import datetime
 
-from Source.Services.search_on_index import AdvancedUnifiedContentSearch
+from Source.Services.search_on_index import AdvancedUnifiedContentSearch, normalize_query, request_key as make_request_key
 from Source.Services.blob_manager import BlobManager
 from Source.Services.prompt_loader import get_prompt_loader
+from Source.Services.semantic_cache import SemanticCache
+from Source.Services.shared_clients import get_openai_client, close_openai_client
 from Config.config import (
-    AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_VERSION,
-    AZURE_OPENAI_CHAT_COMPLETION_MODEL, INDEX_NAME
+    AZURE_OPENAI_CHAT_COMPLETION_MODEL, AZURE_OPENAI_EMBEDDING_MODEL, INDEX_NAME, OPENAI_KEEPALIVE_INTERVAL
 )
-from Config.logging_config import setup_logging
+from Config.logging_config import setup_logging, LOGGER_NAME
 
-# Initialize logger
-logger = setup_logging()
+# Shared application logger (handlers are attached once by setup_logging)
+logger = logging.getLogger(LOGGER_NAME)
+
+# Template for the current user turn (query + retrieved context), formatted per request
+USER_MESSAGE_TEMPLATE = """User query: {user_message}
+
+Relevant context:
+{context}"""
+
+# Markers of USER_MESSAGE_TEMPLATE - used to strip retrieved context from past user turns
+USER_QUERY_PREFIX = "User query: "
+CONTEXT_MARKER = "\n\nRelevant context:"
+
+# Most recent user/assistant turns replayed to the model (older messages are summarized)
+MAX_HISTORY_TURNS = 6
+
+# Summary of the turns older than MAX_HISTORY_TURNS - built in the background (so it may
+# lag a turn behind) and extended incrementally as more turns fall out of the window
+SUMMARY_INSTRUCTIONS = (
+    "Summarize this tutoring conversation between a student and an AI teaching assistant "
+    "in a few sentences, in the conversation's language. Keep the topics covered, what the "
+    "student understood or struggled with, and any open questions. If a previous summary is "
+    "given, extend it with the new messages."
+)
+SUMMARY_MAX_TOKENS = 300
+# Max conversations whose summary is kept (least recently used dropped first)
+SUMMARY_CACHE_SIZE = 1024
+
+# Answer returned when the search finds no relevant chunks
+NO_RESULTS_ANSWER = "מצטער, לא מצאתי מידע רלוונטי לשאלתך במאגר הידע. אנא נסה לנסח את השאלה בצורה אחרת."
+
+# Completion token cap per user stage - callers can override with max_tokens
+STAGE_MAX_TOKENS = {
+    "quiz_mode": 800,
+    "regular_chat": 1500,
+    "presentation_discussion": 2500,
+}
+DEFAULT_MAX_TOKENS = 1500
+
+# Seconds a generated answer is served to re-asks of the same question
+RESPONSE_CACHE_TTL = 15 * 60
+
+# Max number of composed system prompts kept per RAGSystem
+SYSTEM_PROMPT_CACHE_SIZE = 64
+
+# Seconds a downloaded syllabus is reused before it is fetched from blob storage again
+SYLLABUS_CACHE_TTL = 300
+
+# Per-chunk cap on text sent to the model - bounds the prompt at roughly chunks * MAX_CHUNK_CHARS
+MAX_CHUNK_CHARS = 1500
+
+# Characters of chunk text returned to the client as a source preview
+PREVIEW_CHARS = 300
+
+# Chunk fields copied into source info only when present
+OPTIONAL_SOURCE_FIELDS = ("start_time", "end_time", "section_title")
+
+# subject_type values accepted from callers -> prompt family in free_chat_prompt.md
+SUBJECT_FAMILIES = {
+    "מתמטי": "Mathematics",
+    "Mathematics": "Mathematics",
+    "Mathematical": "Mathematics",
+    "הומני": "Humanities",
+    "Humanities": "Humanities",
+    "Humanistic": "Humanities",
+}
+
+# (family, has_syllabus, has_course_name) -> prompt section name, built once at import
+SYSTEM_PROMPT_SECTIONS = {
+    (family, has_syllabus, has_course_name):
+        f"System - {family}"
+        + (" - Syllabus" if has_syllabus else "")
+        + (" - course_name" if has_course_name else "")
+    for family in ("Mathematics", "Humanities", "General")
+    for has_syllabus in (False, True)
+    for has_course_name in (False, True)
+}
+
+
+@dataclass(slots=True)
+class RAGResponse:
+    """Result of RAGSystem.generate_answer - all request fields plus the answer"""
+    conversation_id: str
+    conversation_history: List[Dict]
+    course_id: str
+    user_message: str
+    stage: str
+    final_answer: str
+    sources: List[Dict]
+    timestamp: str
+    success: bool
+    error: Optional[str] = None
 
 
 class RAGSystem:
@@ -51,7 +147,7 @@ class RAGSystem:
         Initialize RAG System
 
         Args:
-            openai_client: Shared OpenAI client
+            openai_client: Shared OpenAI client (defaults to the process-wide client)
             search_system: Shared search system
             blob_manager: Shared blob manager
             prompt_loader: Shared prompt loader
@@ -60,17 +156,45 @@ class RAGSystem:
         self.index_name = index_name
 
         # Use provided objects or create fallbacks
-        self.search_system = search_system or AdvancedUnifiedContentSearch(index_name)
-        self.openai_client = openai_client or AsyncAzureOpenAI(
-            api_key=AZURE_OPENAI_API_KEY,
-            api_version=AZURE_OPENAI_API_VERSION,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT
-        )
+        self.openai_client = openai_client or get_openai_client()
+        self.search_system = search_system or AdvancedUnifiedContentSearch(index_name,
+                                                                           openai_client=self.openai_client)
         self.blob_manager = blob_manager or BlobManager()
         self.prompt_loader = prompt_loader or get_prompt_loader()
 
         self.chat_model = AZURE_OPENAI_CHAT_COMPLETION_MODEL
-        logger.info(f"RAG System initialized with index: {index_name}, model: {self.chat_model}")
+
+        # course_id -> (load time, syllabus content); one lock per course so concurrent
+        # cold requests for the same course trigger a single blob download
+        self._syllabus_cache: Dict[str, Tuple[float, str]] = {}
+        self._syllabus_locks: Dict[str, asyncio.Lock] = {}
+        self._syllabus_ttl = SYLLABUS_CACHE_TTL
+
+        # (section, syllabus_content, course_name) -> formatted system prompt. The syllabus
+        # string comes from the syllabus cache, so its hash is computed once and reused
+        self._system_prompt_cache: Dict[Tuple[str, str, Optional[str]], str] = {}
+
+        # conversation_id -> (older messages covered, summary of them); conversation_id -> task
+        # updating that summary (references kept so pending tasks aren't garbage collected)
+        self._summaries: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self._summary_tasks: Dict[str, asyncio.Task] = {}
+
+        # (final_answer, sources) by (course_id, stage, source_id, subject_type, course_name,
+        # history digest), query embedding and normalized text - re-asked questions skip search
+        # and generation
+        self._response_cache = SemanticCache(ttl=RESPONSE_CACHE_TTL)
+
+        # Request key -> task generating its answer, while in flight
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+
+        # Optional background pings so bursty traffic doesn't hit a cold (torn down) connection
+        self._keepalive_task = None
+        if OPENAI_KEEPALIVE_INTERVAL > 0:
+            try:
+                self._keepalive_task = asyncio.get_running_loop().create_task(self._keepalive_loop())
+            except RuntimeError:
+                logger.warning("No running event loop - OpenAI keep-alive pings disabled")
+        logger.info("RAG System initialized with index: %s, model: %s", index_name, self.chat_model)
 
     def _remove_duplicates_by_id(self, chunks: List[Dict]) -> List[Dict]:
         if not chunks:
@@ -86,60 +210,85 @@ class RAGSystem:
                 unique_chunks.append(chunk)
 
         if len(unique_chunks) < len(chunks):
-            logger.info(f"Deleted: {len(chunks) - len(unique_chunks)} chunks. Remains: {len(unique_chunks)}")
+            logger.info("Deleted: %s chunks. Remains: %s", len(chunks) - len(unique_chunks), len(unique_chunks))
 
         return unique_chunks
 
+    async def _keepalive_loop(self):
+        """Send a tiny embeddings request every OPENAI_KEEPALIVE_INTERVAL seconds to keep the pool warm"""
+        while True:
+            await asyncio.sleep(OPENAI_KEEPALIVE_INTERVAL)
+            try:
+                await self.openai_client.embeddings.create(model=AZURE_OPENAI_EMBEDDING_MODEL, input="ping")
+            except Exception as e:
+                logger.debug("OpenAI keep-alive ping failed: %s", e)
+
     async def close(self):
-        """Close all async resources"""
+        """
+        Stop this instance's background tasks (keep-alive pings, summary updates)
+
+        The OpenAI, search and blob clients are process-wide and shared with other services -
+        they are closed once by their owner (the app lifespan), not here
+        """
         try:
-            # Close OpenAI client
-            if hasattr(self, 'openai_client') and self.openai_client:
-                await self.openai_client.close()
-                logger.info("RAG System OpenAI client closed")
-
-            # Close search system resources
-            if hasattr(self, 'search_system') and self.search_system:
-                if hasattr(self.search_system, 'openai_client') and self.search_system.openai_client:
-                    await self.search_system.openai_client.close()
-                    logger.info("Search system OpenAI client closed")
-
-            # Close blob manager resources
-            if hasattr(self, 'blob_manager') and self.blob_manager:
-                if hasattr(self.blob_manager, '_async_client') and self.blob_manager._async_client:
-                    await self.blob_manager._async_client.close()
-                    logger.info("Blob manager client - closed")
+            # Stop keep-alive pings before closing the client they use
+            if self._keepalive_task:
+                self._keepalive_task.cancel()
+                try:
+                    await self._keepalive_task
+                except asyncio.CancelledError:
+                    pass
+                self._keepalive_task = None
+
+            for task in list(self._summary_tasks.values()):
+                task.cancel()
 
         except Exception as e:
-            logger.error(f"Error closing RAG System resources: {e}")
+            logger.error("Error closing RAG System resources: %s", e)
 
     async def _load_syllabus(self, course_id: str) -> str:
         """
         Load syllabus content for the given course_id from blob storage
 
+        Results (including "not found") are cached per course for SYLLABUS_CACHE_TTL seconds
+
         Args:
             course_id: Course identifier
 
         Returns:
             Syllabus content as string, or empty string if not found
         """
-        try:
-            syllabus_blob_name = f"{course_id}/syllabus.md"
-
-            # Download syllabus content to memory
-            syllabus_bytes = await self.blob_manager.download_to_memory(syllabus_blob_name)
+        cached = self._syllabus_cache.get(course_id)
+        if cached and time.monotonic() - cached[0] < self._syllabus_ttl:
+            return cached[1]
+
+        lock = self._syllabus_locks.setdefault(course_id, asyncio.Lock())
+        async with lock:
+            # Another request may have filled the cache while we waited for the lock
+            cached = self._syllabus_cache.get(course_id)
+            if cached and time.monotonic() - cached[0] < self._syllabus_ttl:
+                return cached[1]
+
+            try:
+                syllabus_blob_name = f"{course_id}/syllabus.md"
+
+                # Download syllabus content to memory
+                syllabus_bytes = await self.blob_manager.download_to_memory(syllabus_blob_name)
+
+                if syllabus_bytes:
+                    syllabus_content = syllabus_bytes.decode('utf-8')
+                    logger.info("Loaded syllabus for course %s from blob: %s", course_id, syllabus_blob_name)
+                else:
+                    logger.warning("Syllabus file not found in blob: %s", syllabus_blob_name)
+                    syllabus_content = ""
 
-            if syllabus_bytes:
-                syllabus_content = syllabus_bytes.decode('utf-8')
-                logger.info(f"Loaded syllabus for course {course_id} from blob: {syllabus_blob_name}")
+                self._syllabus_cache[course_id] = (time.monotonic(), syllabus_content)
                 return syllabus_content
-            else:
-                logger.warning(f"Syllabus file not found in blob: {syllabus_blob_name}")
-                return ""
 
-        except Exception as e:
-            logger.error(f"Error loading syllabus for course {course_id}: {e}")
-            return ""
+            except Exception as e:
+                # Not cached - the next request retries the download
+                logger.error("Error loading syllabus for course %s: %s", course_id, e)
+                return ""
 
     async def generate_answer(
             self,
@@ -152,8 +301,11 @@ class RAGSystem:
             subject_type: str = None,
             course_name: str = None,
             top_k: int = 5,
-            temperature: float = 0.3
-    ) -> Dict:
+            temperature: float = 0.3,
+            max_tokens: int = None,
+            copy_history: bool = False,
+            request_key: str = None
+    ) -> RAGResponse:
         """
         Main function - Generate RAG-based answer with all conversation fields
 
@@ -166,142 +318,450 @@ class RAGSystem:
             source_id: optional source filter
             top_k: Number of chunks to retrieve from search
             temperature: Creativity level (0-1)
+            max_tokens: Completion token cap (defaults to the stage cap in STAGE_MAX_TOKENS)
+            copy_history: Copy conversation_history before appending the new exchange.
+                By default the caller's list is appended to in place and returned
+            request_key: request_key() of (course_id, stage, source_id, user_message), if the
+                caller already computed it (computed here otherwise)
 
         Returns:
-            Dict with all required fields, final answer, and sources
+            RAGResponse with all required fields, final answer, and sources
         """
         try:
-            logger.debug(f"Processing RAG query: {user_message}")
+            logger.debug("Processing RAG query")
 
-            # Step 1: Load syllabus for the course
-            syllabus_content = await self._load_syllabus(course_id)
+            # Identical requests in flight at the same time (same question, filters and recent
+            # history - e.g. client retries) share one search + completion
+            inflight_key = (
+                request_key or make_request_key(course_id, stage, source_id, user_message),
+                subject_type, course_name, top_k, temperature, max_tokens, self._history_digest(conversation_history)
+            )
+            answer_task = self._inflight.get(inflight_key)
+            if answer_task is None:
+                answer_task = asyncio.create_task(self._answer(
+                    conversation_id, conversation_history, course_id, user_message, stage, source_id,
+                    subject_type, course_name, top_k, temperature, max_tokens
+                ))
+                self._inflight[inflight_key] = answer_task
+                answer_task.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+            # Shielded - a disconnecting caller must not cancel the answer the others wait for
+            answer = await asyncio.shield(answer_task)
+
+            if answer is None:
+                return RAGResponse(
+                    conversation_id=conversation_id,
+                    conversation_history=conversation_history,
+                    course_id=course_id,
+                    user_message=user_message,
+                    stage=stage,
+                    final_answer=NO_RESULTS_ANSWER,
+                    sources=[],
+                    timestamp=datetime.now().isoformat(),
+                    success=False,
+                    error="No relevant content found in RAG"
+                )
+
+            final_answer, sources = answer
+
+            # Response time - shared by both new history entries and the response
+            timestamp = datetime.now().isoformat()
+
+            # Step 7: Build updated conversation history including the new exchange
+            updated_conversation_history = self._build_updated_history(
+                conversation_history, user_message, final_answer, timestamp, copy_history
+            )
 
-            # Step 2: Search relevant chunks using enhanced search with adjacent chunks
-            search_results = await self.search_system.search_best_answers(
-                query=user_message,
-                k=top_k,
-                source_id=source_id,
-                course_id=course_id
+            # Return complete structure with updated conversation history
+            return RAGResponse(
+                conversation_id=conversation_id,
+                conversation_history=updated_conversation_history,
+                course_id=course_id,
+                user_message=user_message,
+                stage=stage,
+                final_answer=final_answer,
+                sources=sources,
+                timestamp=timestamp,
+                success=True
             )
 
-            if not search_results:
-                logger.warning(f"No relevant content found for query: {user_message}")
-                return {
-                    "conversation_id": conversation_id,
-                    "conversation_history": conversation_history,
-                    "course_id": course_id,
-                    "user_message": user_message,
-                    "stage": stage,
-                    "final_answer": "מצטער, לא מצאתי מידע רלוונטי לשאלתך במאגר הידע. אנא נסה לנסח את השאלה בצורה אחרת.",
-                    "sources": [],
-                    "timestamp": datetime.now().isoformat(),
-                    "success": False,
-                    "error": "No relevant content found in RAG"
-                }
-
-            logger.debug(f"Found {len(search_results)} relevant chunks")
-
-            # Step 2.5: Remove duplicates by ID before processing
-            search_results = self._remove_duplicates_by_id(search_results)
-
-            # Step 3: Build context from chunks
-            context = self._build_context_from_chunks(search_results)
-
-            # Step 4: Build messages array with conversation history and current query
-            messages = self._build_conversation_messages(conversation_history, user_message, context, syllabus_content,
-                                                         subject_type, course_name)
-
-            # Log the final prompt for debugging
-            logger.info("=== Final prompt being sent to model ===")
-            for i, message in enumerate(messages):
-                logger.info(f"Message {i + 1} - Role: {message['role']}")
-                logger.info(f"Content:\n{message['content']}")
-                logger.info("=" * 50)
-
-            # Step 4: Send to language model
-            response = await self.openai_client.chat.completions.create(
+        except Exception as e:
+            logger.error("Error in RAG generation: %s", e)
+            return RAGResponse(
+                conversation_id=conversation_id,
+                conversation_history=conversation_history,
+                course_id=course_id,
+                user_message=user_message,
+                stage=stage,
+                final_answer=f"Error: {str(e)}",
+                sources=[],
+                timestamp=datetime.now().isoformat(),
+                success=False,
+                error=str(e)
+            )
+
+    async def _answer(
+            self,
+            conversation_id: str,
+            conversation_history: List[Dict],
+            course_id: str,
+            user_message: str,
+            stage: str,
+            source_id: str,
+            subject_type: str,
+            course_name: str,
+            top_k: int,
+            temperature: float,
+            max_tokens: Optional[int]
+    ) -> Optional[Tuple[str, List[Dict]]]:
+        """Get (final_answer, sources) from the response cache or search + generation - None if nothing was found"""
+        # The history (recent turns and summary) is part of the prompt, so it is part of the cache
+        # namespace - a context-dependent follow-up ("explain more") must not get another conversation's answer
+        cache_key = (course_id, stage, source_id, subject_type, course_name, self._history_digest(conversation_history))
+        query_vector, unit_vector, cached = await self._lookup_response(user_message, cache_key)
+        if cached is not None:
+            return cached
+
+        # Steps 1-5: Search relevant chunks and build the prompt
+        messages, sources = await self._prepare_messages(
+            conversation_history, course_id, user_message, source_id, subject_type, course_name, top_k,
+            session_id=conversation_id, query_vector=query_vector
+        )
+        if messages is None:
+            return None
+
+        # Step 6: Send to language model
+        response = await self.openai_client.chat.completions.create(
+            model=self.chat_model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens or STAGE_MAX_TOKENS.get(stage, DEFAULT_MAX_TOKENS)
+        )
+
+        final_answer = response.choices[0].message.content.strip()
+        logger.debug("Generated answer")
+        if unit_vector is not None:
+            self._response_cache.put(unit_vector, cache_key, (final_answer, sources), normalize_query(user_message))
+        return final_answer, sources
+
+    @staticmethod
+    def _history_digest(conversation_history: List[Dict]) -> str:
+        """
+        Digest of the whole history - requests with equal digests get the same prompt. The recent
+        turns are replayed to the model and the older ones reach it through the conversation
+        summary, so all of them count (two conversations may share only their recent turns)
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for msg in conversation_history or ():
+            digest.update(f"{msg.get('role')}\x1f{msg.get('content')}\x1e".encode())
+        return digest.hexdigest()
+
+    async def generate_answer_stream(
+            self,
+            conversation_id: str,
+            conversation_history: List[Dict],
+            course_id: str,
+            user_message: str,
+            stage: str,
+            source_id: str = None,
+            subject_type: str = None,
+            course_name: str = None,
+            top_k: int = 5,
+            temperature: float = 0.3,
+            max_tokens: int = None,
+            copy_history: bool = False
+    ) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of generate_answer
+
+        Uses the same search and prompt as generate_answer, but sends the completion request
+        with stream=True so the first tokens reach the caller without waiting for the full answer.
+        Once the stream ends, the collected answer is added to the conversation history
+
+        Yields:
+            {"event": "delta", "data": answer text} for every piece of the answer, then a single
+            {"event": "done", "data": RAGResponse} with the updated history and sources
+        """
+        try:
+            logger.debug("Processing streaming RAG query")
+
+            cache_key = (
+                course_id, stage, source_id, subject_type, course_name, self._history_digest(conversation_history)
+            )
+            query_vector, unit_vector, cached = await self._lookup_response(user_message, cache_key)
+
+            if cached is not None:
+                final_answer, sources = cached
+                yield {"event": "delta", "data": final_answer}
+                timestamp = datetime.now().isoformat()
+                yield {"event": "done", "data": RAGResponse(
+                    conversation_id=conversation_id,
+                    conversation_history=self._build_updated_history(
+                        conversation_history, user_message, final_answer, timestamp, copy_history
+                    ),
+                    course_id=course_id,
+                    user_message=user_message,
+                    stage=stage,
+                    final_answer=final_answer,
+                    sources=sources,
+                    timestamp=timestamp,
+                    success=True
+                )}
+                return
+
+            messages, sources = await self._prepare_messages(
+                conversation_history, course_id, user_message, source_id, subject_type, course_name, top_k,
+                session_id=conversation_id, query_vector=query_vector
+            )
+
+            if messages is None:
+                yield {"event": "delta", "data": NO_RESULTS_ANSWER}
+                yield {"event": "done", "data": RAGResponse(
+                    conversation_id=conversation_id,
+                    conversation_history=conversation_history,
+                    course_id=course_id,
+                    user_message=user_message,
+                    stage=stage,
+                    final_answer=NO_RESULTS_ANSWER,
+                    sources=[],
+                    timestamp=datetime.now().isoformat(),
+                    success=False,
+                    error="No relevant content found in RAG"
+                )}
+                return
+
+            stream = await self.openai_client.chat.completions.create(
                 model=self.chat_model,
                 messages=messages,
-                temperature=temperature
+                temperature=temperature,
+                max_tokens=max_tokens or STAGE_MAX_TOKENS.get(stage, DEFAULT_MAX_TOKENS),
+                stream=True
             )
 
-            final_answer = response.choices[0].message.content.strip()
-            logger.debug(f"Generated answer for query: {user_message}")
+            answer_parts = []
+            async for chunk in stream:
+                # Azure may send chunks without choices (e.g. content filter results)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    delta = chunk.choices[0].delta.content
+                    answer_parts.append(delta)
+                    yield {"event": "delta", "data": delta}
+
+            final_answer = "".join(answer_parts).strip()
+            logger.debug("Streamed answer")
+            if unit_vector is not None:
+                self._response_cache.put(unit_vector, cache_key, (final_answer, sources), normalize_query(user_message))
+
+            timestamp = datetime.now().isoformat()
+            yield {"event": "done", "data": RAGResponse(
+                conversation_id=conversation_id,
+                conversation_history=self._build_updated_history(
+                    conversation_history, user_message, final_answer, timestamp, copy_history
+                ),
+                course_id=course_id,
+                user_message=user_message,
+                stage=stage,
+                final_answer=final_answer,
+                sources=sources,
+                timestamp=timestamp,
+                success=True
+            )}
 
-            # Step 5: Process sources - always return sources
-            sources = self._extract_sources_info(search_results)
+        except Exception as e:
+            logger.error("Error in streaming RAG generation: %s", e)
+            yield {"event": "done", "data": RAGResponse(
+                conversation_id=conversation_id,
+                conversation_history=conversation_history,
+                course_id=course_id,
+                user_message=user_message,
+                stage=stage,
+                final_answer=f"Error: {str(e)}",
+                sources=[],
+                timestamp=datetime.now().isoformat(),
+                success=False,
+                error=str(e)
+            )}
+
+    async def _lookup_response(
+            self,
+            user_message: str,
+            cache_key: Tuple
+    ) -> Tuple[List[float], Optional[np.ndarray], Optional[Tuple[str, List[Dict]]]]:
+        """
+        Embed the user message and look up a cached answer to the same question
 
-            # Step 6: Build updated conversation history including the new exchange
-            updated_conversation_history = conversation_history.copy() if conversation_history else []
+        Returns:
+            Tuple of (query_vector, unit_vector, cached): the embedding (reused by the search),
+            its normalized form for storing the answer (None if embedding failed), and the
+            cached (final_answer, sources) or None
+        """
+        query_vector = await self.search_system.generate_query_embedding(user_message)
+        if not query_vector:
+            return query_vector, None, None
+
+        unit_vector = self._response_cache.normalize(query_vector)
+        # A generated answer is only served for the same question - a near embedding can still
+        # differ in meaning (negation, numbers)
+        cached = self._response_cache.get(unit_vector, cache_key, normalize_query(user_message))
+        if cached is not None:
+            logger.info("Response cache hit")
+        return query_vector, unit_vector, cached
+
+    def invalidate_cache(self, course_id: str) -> int:
+        """Drop cached answers and search results for a course (e.g. after it was re-indexed)"""
+        return (self._response_cache.invalidate(lambda cache_key: cache_key[0] == course_id)
+                + self.search_system.invalidate_cache(course_id))
+
+    async def _prepare_messages(
+            self,
+            conversation_history: List[Dict],
+            course_id: str,
+            user_message: str,
+            source_id: str = None,
+            subject_type: str = None,
+            course_name: str = None,
+            top_k: int = 5,
+            session_id: str = None,
+            query_vector: List[float] = None
+    ) -> Tuple[Optional[List[Dict]], List[Dict]]:
+        """
+        Search relevant chunks and build the full messages array for the model
+        session_id (the conversation id) keeps a conversation's searches on one search replica;
+        query_vector is the user message's embedding, if already computed
 
-            # Add the current user message WITH context (as it was sent to the model)
-            user_message_with_context = f"""User query: {user_message}
+        Returns:
+            Tuple of (messages, list of source info dicts).
+            messages is None when the search found no relevant content
+        """
+        # Steps 1-2: Load the course syllabus and search relevant chunks (enhanced search
+        # with adjacent chunks) concurrently - both are independent network calls
+        syllabus_content, search_results = await asyncio.gather(
+            self._load_syllabus(course_id),
+            self.search_system.search_best_answers(
+                query=user_message,
+                k=top_k,
+                source_id=source_id,
+                course_id=course_id,
+                query_vector=query_vector,
+                session_id=session_id
+            ),
+            return_exceptions=True
+        )
 
-Relevant context:
-{context}"""
+        if isinstance(syllabus_content, Exception):
+            logger.error("Error loading syllabus for course %s: %s", course_id, syllabus_content)
+            syllabus_content = ""
 
-            updated_conversation_history.append({
-                "role": "user",
-                "content": user_message_with_context,
-                "timestamp": datetime.now().isoformat()
-            })
+        if isinstance(search_results, Exception):
+            logger.error("Error searching relevant chunks: %s", search_results)
+            search_results = []
 
-            # Add the assistant response to history
-            updated_conversation_history.append({
-                "role": "assistant",
-                "content": final_answer,
-                "timestamp": datetime.now().isoformat()
-            })
+        if not search_results:
+            logger.warning("No relevant content found for query")
+            return None, []
 
-            # Return complete structure with updated conversation history
-            return {
-                "conversation_id": conversation_id,
-                "conversation_history": updated_conversation_history,
-                "course_id": course_id,
-                "user_message": user_message,
-                "stage": stage,
-                "final_answer": final_answer,
-                "sources": sources,
-                "timestamp": datetime.now().isoformat(),
-                "success": True
-            }
+        logger.debug("Found %s relevant chunks", len(search_results))
 
-        except Exception as e:
-            logger.error(f"Error in RAG generation: {e}")
-            return {
-                "conversation_id": conversation_id,
-                "conversation_history": conversation_history,
-                "course_id": course_id,
-                "user_message": user_message,
-                "stage": stage,
-                "final_answer": f"Error: {str(e)}",
-                "sources": [],
-                "timestamp": datetime.now().isoformat(),
-                "success": False,
-                "error": str(e)
-            }
+        # Step 2.5: Remove duplicates by ID before processing
+        search_results = self._remove_duplicates_by_id(search_results)
+
+        # Step 3: Build system prompt and conversation history
+        summary = self._get_summary(session_id, conversation_history)
+        messages = self._build_conversation_messages(conversation_history, syllabus_content,
+                                                     subject_type, course_name, summary)
+
+        # Step 4: Build context and source info from chunks (single pass)
+        context, sources = self._build_context_and_sources(search_results)
+
+        # Step 5: Add the current query with its retrieved context
+        messages.append({
+            "role": "user",
+            "content": USER_MESSAGE_TEMPLATE.format_map({"user_message": user_message, "context": context})
+        })
+
+        # Log the prompt shape for debugging (sizes only - contents include syllabus and chunks)
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, message in enumerate(messages, 1):
+                logger.debug("Message %d role=%s len=%d", i, message['role'], len(message['content']))
+
+        return messages, sources
+
+    def _build_updated_history(self, conversation_history: List[Dict], user_message: str, final_answer: str,
+                               timestamp: str, copy_history: bool = False) -> List[Dict]:
+        """
+        Return the conversation history with the new user/assistant exchange appended
+
+        The caller's list is extended in place unless copy_history is set
+        """
+        if conversation_history is None:
+            updated_conversation_history = []
+        elif copy_history:
+            updated_conversation_history = conversation_history.copy()
+        else:
+            updated_conversation_history = conversation_history
+
+        # Add the current user message only - its retrieved context is rebuilt per turn,
+        # so storing it would just be replayed (and grow) on every later request
+        updated_conversation_history.append({
+            "role": "user",
+            "content": user_message,
+            "timestamp": timestamp
+        })
+
+        # Add the assistant response to history
+        updated_conversation_history.append({
+            "role": "assistant",
+            "content": final_answer,
+            "timestamp": timestamp
+        })
 
-    def _build_context_from_chunks(self, chunks: List[Dict]) -> str:
+        return updated_conversation_history
+
+    def _build_context_and_sources(self, chunks: List[Dict], max_chunk_chars: int = MAX_CHUNK_CHARS,
+                                   preview_chars: int = PREVIEW_CHARS) -> Tuple[str, List[Dict]]:
         """
-        Build focused context from found chunks
+        Build focused context for the model and source info for display in one pass
+
+        Each chunk's text is truncated to max_chunk_chars in the context and to
+        preview_chars in its source's text_preview
+
+        Returns:
+            Tuple of (context string, list of source info dicts)
         """
         context_parts = []
+        sources = []
 
         for i, chunk in enumerate(chunks, 1):
-            text = chunk.get('text', '')
+            text = chunk.get('text') or ''
 
             # Simple source numbering - don't worry about metadata fields
-            source_info = f"Source {i}"
-            context_parts.append(f"{source_info}:\n{text}")
+            context_parts.append(f"Source {i}:\n{text[:max_chunk_chars]}")
+
+            # Extract all available fields without worrying about content_type
+            source_info = {
+                "index": i,
+                "source_id": chunk.get('source_id', ''),
+                "course_id": chunk.get('course_id', ''),
+                "chunk_index": chunk.get('chunk_index', 0),
+                "relevance_score": chunk.get('@search.score', 0),
+                "text_preview": text[:preview_chars]
+            }
 
-        return "\n\n".join(context_parts)
+            # Add any additional fields that exist (don't filter by content_type)
+            for field in OPTIONAL_SOURCE_FIELDS:
+                value = chunk.get(field)
+                if value:
+                    source_info[field] = value
+
+            sources.append(source_info)
 
-    def _build_conversation_messages(self, conversation_history: List[Dict], user_message: str, context: str,
-                                     syllabus_content: str = "", subject_type: str = None, course_name: str = None) -> List[
-        Dict]:
+        return "\n\n".join(context_parts), sources
+
+    def _build_conversation_messages(self, conversation_history: List[Dict], syllabus_content: str = "",
+                                     subject_type: str = None, course_name: str = None,
+                                     summary: str = "") -> List[Dict]:
         """
-        Build messages array with proper conversation structure including system prompt,
-        conversation history, and current query with context and syllabus
+        Build messages array with proper conversation structure including system prompt
+        with syllabus, a summary of older turns (if any) and the recent conversation history.
+        The current query is appended by the caller once the search results (its context) are available
         """
         messages = []
 
@@ -311,9 +771,15 @@ Relevant context:
             "content": self._get_system_prompt(syllabus_content, subject_type, course_name)
         })
 
-        # Add conversation history (all messages)
+        if summary:
+            messages.append({
+                "role": "system",
+                "content": "Summary of the earlier conversation:\n" + summary
+            })
+
+        # Add the most recent conversation history (a turn is a user + assistant message)
         if conversation_history:
-            for msg in conversation_history:
+            for msg in conversation_history[-2 * MAX_HISTORY_TURNS:]:
                 role = msg.get('role', 'user')
                 content = msg.get('content', '')
 
@@ -321,124 +787,118 @@ Relevant context:
                 if role not in ['assistant', 'user']:
                     role = 'user'
 
+                # Legacy histories stored user turns with their retrieved context - keep the question only
+                if role == 'user':
+                    content = self._strip_context(content)
+
                 messages.append({
                     "role": role,
                     "content": content
                 })
 
-        # Add current user message with context
-        user_message_with_context = f"""User query: {user_message}
-
-        Relevant context:
-        {context}"""
-
-        messages.append({
-            "role": "user",
-            "content": user_message_with_context
-        })
-
         return messages
 
-    def _get_system_prompt(self, syllabus_content: str = "", subject_type: str = None, course_name: str = None) -> str:
+    def _get_summary(self, conversation_id: str, conversation_history: List[Dict]) -> str:
         """
-        Define system behavior with optional syllabus context and subject type using injected prompt_loader
-        """
-        # Determine the appropriate prompt section based on subject_type, syllabus availability, and course_name
-        if subject_type and subject_type in ["מתמטי", "Mathematics", "Mathematical"]:
-            if syllabus_content:
-                # Mathematical subject with syllabus
-                if course_name:
-                    section = "System - Mathematics - Syllabus - course_name"
-                else:
-                    section = "System - Mathematics - Syllabus"
-            else:
-                # Mathematical subject without syllabus
-                if course_name:
-                    section = "System - Mathematics - course_name"
-                else:
-                    section = "System - Mathematics"
-        elif subject_type and subject_type in ["הומני", "Humanities", "Humanistic"]:
-            if syllabus_content:
-                # Humanities subject with syllabus
-                if course_name:
-                    section = "System - Humanities - Syllabus - course_name"
-                else:
-                    section = "System - Humanities - Syllabus"
-            else:
-                # Humanities subject without syllabus
-                if course_name:
-                    section = "System - Humanities - course_name"
-                else:
-                    section = "System - Humanities"
-        else:
-            if syllabus_content:
-                # General prompt with syllabus
-                if course_name:
-                    section = "System - General - Syllabus - course_name"
-                else:
-                    section = "System - General - Syllabus"
-            else:
-                # General prompt without syllabus
-                if course_name:
-                    section = "System - General - course_name"
-                else:
-                    section = "System - General"
+        Get the summary of the messages older than the replay window
 
-        logger.info(f"Using prompt section: {section}")
+        Never waits for the model: returns the stored summary (possibly a turn behind, or ""
+        on the first overflowing turn) and, if more messages fell out of the window since it
+        was made, starts a background task extending it
+        """
+        overflow = len(conversation_history or ()) - 2 * MAX_HISTORY_TURNS
+        if not conversation_id or overflow <= 0:
+            return ""
 
-        prompt = self.prompt_loader.get_prompt(
-            "free_chat",
-            section,
-            syllabus_content=syllabus_content,
-            course_name=course_name
+        covered, summary = self._summaries.get(conversation_id, (0, ""))
+        if covered > overflow:
+            # History shorter than what was summarized (e.g. the client reset it) - start over
+            covered, summary = 0, ""
+        elif conversation_id in self._summaries:
+            self._summaries.move_to_end(conversation_id)
+
+        if covered < overflow and conversation_id not in self._summary_tasks:
+            task = asyncio.create_task(self._update_summary(
+                conversation_id, summary, conversation_history[covered:overflow], overflow
+            ))
+            self._summary_tasks[conversation_id] = task
+            task.add_done_callback(lambda _: self._summary_tasks.pop(conversation_id, None))
+
+        return summary
+
+    async def _update_summary(self, conversation_id: str, previous_summary: str, new_messages: List[Dict],
+                              covered: int):
+        """Extend a conversation's summary with the messages that left the replay window"""
+        transcript = "\n".join(
+            f"{'Student' if msg.get('role') == 'user' else 'Assistant'}: {self._strip_context(msg.get('content', ''))}"
+            for msg in new_messages
         )
+        if previous_summary:
+            transcript = f"Previous summary:\n{previous_summary}\n\nNew messages:\n{transcript}"
 
-        # Log the final prompt for debugging
-        logger.info("=== SELECTED SYSTEM PROMPT ===")
-        logger.info(f"Section: {section}")
-        logger.info(f"Subject Type: {subject_type}")
-        logger.info(f"Course Name: {course_name}")
-        logger.info(f"Has Syllabus: {'Yes' if syllabus_content else 'No'}")
-        logger.info("Prompt Content:")
-        logger.info(prompt)
-        logger.info("=" * 50)
-
-        return prompt
+        try:
+            response = await self.openai_client.chat.completions.create(
+                model=self.chat_model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                    {"role": "user", "content": transcript}
+                ],
+                temperature=0,
+                max_tokens=SUMMARY_MAX_TOKENS
+            )
+        except Exception as e:
+            logger.warning("Conversation summary failed for %s: %s", conversation_id, e)
+            return
+
+        self._summaries[conversation_id] = (covered, response.choices[0].message.content.strip())
+        self._summaries.move_to_end(conversation_id)
+        if len(self._summaries) > SUMMARY_CACHE_SIZE:
+            self._summaries.popitem(last=False)
+        logger.debug("Summarized %d older messages of conversation %s", covered, conversation_id)
+
+    @staticmethod
+    def _strip_context(content: str) -> str:
+        """Reduce a user message built from USER_MESSAGE_TEMPLATE back to the plain user query"""
+        if CONTEXT_MARKER not in content:
+            return content
+        query = content.partition(CONTEXT_MARKER)[0]
+        return query[len(USER_QUERY_PREFIX):] if query.startswith(USER_QUERY_PREFIX) else query
 
-    def _extract_sources_info(self, chunks: List[Dict]) -> List[Dict]:
+    def _get_system_prompt(self, syllabus_content: str = "", subject_type: str = None, course_name: str = None) -> str:
         """
-        Extract source information for display - simplified without content_type dependencies
+        Define system behavior with optional syllabus context and subject type using injected prompt_loader
         """
-        sources = []
-
-        for i, chunk in enumerate(chunks, 1):
-            # Extract all available fields without worrying about content_type
-            source_info = {
-                "index": i,
-                "source_id": chunk.get('source_id', ''),
-                "course_id": chunk.get('course_id', ''),
-                "chunk_index": chunk.get('chunk_index', 0),
-                "relevance_score": chunk.get('@search.score', 0),
-                "text_preview": chunk.get('text', '')
-            }
-
-            # Add any additional fields that exist (don't filter by content_type)
-            if chunk.get('start_time'):
-                source_info["start_time"] = chunk.get('start_time', '')
-            if chunk.get('end_time'):
-                source_info["end_time"] = chunk.get('end_time', '')
-            if chunk.get('section_title'):
-                source_info["section_title"] = chunk.get('section_title', '')
+        # Determine the appropriate prompt section based on subject_type, syllabus availability, and course_name
+        family = SUBJECT_FAMILIES.get(subject_type, "General") if subject_type else "General"
+        section = SYSTEM_PROMPT_SECTIONS[(family, bool(syllabus_content), bool(course_name))]
+
+        logger.debug("Using prompt section: %s", section)
+
+        # The composed prompt is a pure function of these inputs - format it once per course
+        cache_key = (section, syllabus_content, course_name)
+        prompt = self._system_prompt_cache.get(cache_key)
+        if prompt is None:
+            prompt = self.prompt_loader.get_prompt(
+                "free_chat",
+                section,
+                syllabus_content=syllabus_content,
+                course_name=course_name
+            )
+            if len(self._system_prompt_cache) >= SYSTEM_PROMPT_CACHE_SIZE:
+                self._system_prompt_cache.clear()
+            self._system_prompt_cache[cache_key] = prompt
 
-            sources.append(source_info)
+        logger.debug("System prompt: subject_type=%s course_name=%s has_syllabus=%s len=%d",
+                     subject_type, course_name, bool(syllabus_content), len(prompt))
 
-        return sources
+        return prompt
 
 
 async def main():
     """
     Main function - Free Chat Demo
     """
+    setup_logging()
     try:
         logger.info("Starting Free Chat System Demo")
         print("Free Chat System Demo")
@@ -460,22 +920,22 @@ async def main():
             stage="regular_chat"
         )
 
-        print(f"Conversation ID: {result['conversation_id']}")
-        print(f"Course ID: {result['course_id']}")
-        print(f"Stage: {result['stage']}")
-        print(f"User Message: {result['user_message']}")
-        print(f"Final Answer: {result['final_answer']}")
+        print(f"Conversation ID: {result.conversation_id}")
+        print(f"Course ID: {result.course_id}")
+        print(f"Stage: {result.stage}")
+        print(f"User Message: {result.user_message}")
+        print(f"Final Answer: {result.final_answer}")
 
-        print(f"\nUpdated Conversation History ({len(result.get('conversation_history', []))}) messages:")
-        for i, msg in enumerate(result.get('conversation_history', []), 1):
+        print(f"\nUpdated Conversation History ({len(result.conversation_history)}) messages:")
+        for i, msg in enumerate(result.conversation_history, 1):
             print(f"  Message {i} - Role: {msg.get('role', 'unknown')}")
             print(f"    Timestamp: {msg.get('timestamp', 'N/A')}")
             content = msg.get('content', '')
             print(f"    Content: {content}")
             print()
 
-        print(f"Sources ({len(result.get('sources', []))}):")
-        for i, source in enumerate(result.get('sources', []), 1):
+        print(f"Sources ({len(result.sources)}):")
+        for i, source in enumerate(result.sources, 1):
             print(f"  Source {i}:")
             print(f"    Source ID: {source.get('source_id', 'N/A')}")
             print(f"    Course ID: {source.get('course_id', 'N/A')}")
@@ -487,18 +947,21 @@ async def main():
                 print(f"    Section: {source.get('section_title', '')}")
             print(f"    Preview: {source.get('text_preview', '')}")
             print()
-        print(f"Timestamp: {result['timestamp']}")
-        print(f"Success: {result['success']}")
-        if not result['success']:
-            print(f"Error: {result.get('error', 'Unknown error')}")
+        print(f"Timestamp: {result.timestamp}")
+        print(f"Success: {result.success}")
+        if not result.success:
+            print(f"Error: {result.error or 'Unknown error'}")
 
-        # Close RAG system resources
+        # Close RAG system resources, then the shared clients (the demo owns the process)
         await rag.close()
+        await close_openai_client()
+        await AdvancedUnifiedContentSearch.close()
+        await BlobManager.close()
         logger.info("RAG system resources closed successfully")
 
     except Exception as e:
         print(f"Error: {e}")
-        logger.error(f"Error in main: {e}")
+        logger.error("Error in main: %s", e)
 
 
 if __name__ == "__main__":
@@ -4,10 +4,24 @@ Centralized management of all prompts used in the system
 """
 
 import os
+import re
+import asyncio
+import logging
+from pathlib import Path
 from typing import Dict, Optional, Union
-from Config.logging_config import setup_logging
+from Config.logging_config import setup_logging, LOGGER_NAME
 
-logger = setup_logging()
+# Shared application logger (handlers are attached once by setup_logging)
+logger = logging.getLogger(LOGGER_NAME)
+
+# "## Section Name" headers (not ### sub-headers) - split() yields [preamble, name1, body1, name2, body2, ...]
+SECTION_HEADER_PATTERN = re.compile(r'^## (.+)$', re.MULTILINE)
+
+# Map prompt types to file names (without .md) - fixing name mismatches
+_PROMPT_FILES = {
+    'free_chat': 'free_chat_prompt',
+    'test_myself': 'quiz_myself_prompt'
+}
 
 
 class PromptLoader:
@@ -15,6 +29,14 @@ class PromptLoader:
     Service for loading and managing prompts from MD files with true caching
     """
 
+    # (subject_type, has subject_name) -> section name suffix
+    _SECTION_SUFFIX = {
+        ('מתמטי', True): ' - מתמטי עם שם מקצוע',
+        ('מתמטי', False): ' - מתמטי כללי',
+        ('הומני', True): ' - הומני עם שם מקצוע',
+        ('הומני', False): ' - הומני כללי',
+    }
+
     def __init__(self, prompts_dir: str = "prompts"):
         """
         Initialize prompt loader
@@ -24,12 +46,15 @@ class PromptLoader:
         """
         self.prompts_dir = prompts_dir
         self._prompts_cache: Dict[str, Dict[str, str]] = {}
+        # Parsed sections and modification time per prompt file - a file is only re-read when it changes
+        self._parsed_files: Dict[str, Dict[str, str]] = {}
+        self._prompt_mtimes: Dict[str, float] = {}
         self._cache_loaded = False
         logger.info(f"PromptLoader initialized with directory: {prompts_dir}")
 
     def _load_prompt_file(self, filename: str) -> Dict[str, str]:
         """
-        Load and parse a prompt MD file
+        Load and parse a prompt MD file (returns the previously parsed sections if the file is unchanged)
 
         Args:
             filename: Name of the prompt file (without .md extension)
@@ -39,15 +64,23 @@ class PromptLoader:
         """
         file_path = os.path.join(self.prompts_dir, f"{filename}.md")
 
-        if not os.path.exists(file_path):
+        try:
+            mtime = os.stat(file_path).st_mtime
+        except FileNotFoundError:
             logger.error(f"Prompt file not found: {file_path}")
             return {}
 
+        if filename in self._parsed_files and self._prompt_mtimes.get(filename) == mtime:
+            return self._parsed_files[filename]
+
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
 
-            return self._parse_prompt_content(content)
+            sections = self._parse_prompt_content(content)
+            self._parsed_files[filename] = sections
+            self._prompt_mtimes[filename] = mtime
+            return sections
 
         except Exception as e:
             logger.error(f"Error loading prompt file {file_path}: {e}")
@@ -63,49 +96,21 @@ class PromptLoader:
         Returns:
             Dictionary with parsed sections
         """
-        sections = {}
-        lines = content.split('\n')
-        current_section = None
-        current_content = []
-
-        for line in lines:
-            # Check for section headers (## Section Name)
-            if line.startswith('## ') and not line.startswith('###'):
-                # Save previous section if exists
-                if current_section and current_content:
-                    # Join all content and strip whitespace
-                    section_text = '\n'.join(current_content).strip()
-                    sections[current_section.lower()] = section_text
-
-                # Start new section
-                current_section = line[3:].strip()
-                current_content = []
-                continue
-
-            # Add content to current section (everything except the header)
-            if current_section:
-                current_content.append(line)
-
-        # Save last section
-        if current_section and current_content:
-            section_text = '\n'.join(current_content).strip()
-            sections[current_section.lower()] = section_text
-
-        return sections
+        parts = SECTION_HEADER_PATTERN.split(content)
+
+        # Text before the first header is not part of any section
+        return {
+            name.strip().lower(): body.strip()
+            for name, body in zip(parts[1::2], parts[2::2])
+        }
 
     def preload_all_prompts(self) -> None:
         """
         Preload all prompts into cache at startup
         """
-        # Map prompt types to file names - fixing name mismatches
-        prompt_files = {
-            'free_chat': 'free_chat_prompt',
-            'test_myself': 'quiz_myself_prompt'
-        }
-
         logger.info("Preloading all prompts into cache...")
 
-        for prompt_type, filename in prompt_files.items():
+        for prompt_type, filename in _PROMPT_FILES.items():
             try:
                 prompts = self._load_prompt_file(filename)
                 if prompts:
@@ -119,6 +124,35 @@ class PromptLoader:
         self._cache_loaded = True
         logger.info(f"Preloading complete. Cached {len(self._prompts_cache)} prompt types.")
 
+    async def _load_prompt_file_async(self, filename: str) -> Dict[str, str]:
+        """Load and parse a prompt MD file in a worker thread so the event loop isn't blocked on disk I/O"""
+        return await asyncio.to_thread(self._load_prompt_file, filename)
+
+    async def preload_all_prompts_async(self) -> None:
+        """
+        Preload all prompts into cache - async variant for use inside the event loop
+
+        All prompt files are read concurrently in worker threads
+        """
+        logger.info("Preloading all prompts into cache...")
+
+        results = await asyncio.gather(
+            *[self._load_prompt_file_async(filename) for filename in _PROMPT_FILES.values()],
+            return_exceptions=True
+        )
+
+        for (prompt_type, filename), prompts in zip(_PROMPT_FILES.items(), results):
+            if isinstance(prompts, Exception):
+                logger.error(f"Failed to preload {prompt_type} prompts: {prompts}")
+            elif prompts:
+                self._prompts_cache[prompt_type] = prompts
+                logger.info(f"Preloaded {prompt_type} prompts from {filename}.md")
+            else:
+                logger.warning(f"No content loaded for {prompt_type} from {filename}.md")
+
+        self._cache_loaded = True
+        logger.info(f"Preloading complete. Cached {len(self._prompts_cache)} prompt types.")
+
     def get_prompt(self, prompt_type: str, section: str = "system", reload: bool = False, **kwargs) -> str:
         """
         Get prompt text from cache (or load if not cached) and format with variables
@@ -132,40 +166,23 @@ class PromptLoader:
         Returns:
             Formatted prompt string
         """
-        # Normalize section to lowercase for lookup
-        section_key = section.lower()
+        # Section keys are stored lowercase (normalized when the file is parsed)
+        base_key = section.lower()
+        section_key = base_key
 
-        # If we have subject_type, try to build the appropriate section name
+        # If we have subject_type, pick the matching section variant
         if 'subject_type' in kwargs:
-            subject_type = kwargs.get('subject_type', '').lower()
-            subject_name = kwargs.get('subject_name', '')
-
-            # Try different section name patterns based on subject type and name
-            if subject_type == 'מתמטי' and subject_name:
-                section_key = f"{section} - מתמטי עם שם מקצוע"
-            elif subject_type == 'הומני' and subject_name:
-                section_key = f"{section} - הומני עם שם מקצוע"
-            elif subject_type == 'מתמטי':
-                section_key = f"{section} - מתמטי כללי"
-            elif subject_type == 'הומני':
-                section_key = f"{section} - הומני כללי"
-
-        # Normalize to lowercase for cache lookup
-        section_key = section_key.lower()
-
-        # Map prompt types to file names - with aliases for backward compatibility
-        prompt_files = {
-            'free_chat': 'free_chat_prompt',
-            'test_myself': 'quiz_myself_prompt'
-        }
+            subject_type = (kwargs.get('subject_type') or '').lower()
+            suffix = self._SECTION_SUFFIX.get((subject_type, bool(kwargs.get('subject_name'))), "")
+            section_key = base_key + suffix.lower()
 
-        if prompt_type not in prompt_files:
+        if prompt_type not in _PROMPT_FILES:
             logger.error(f"Unknown prompt type: {prompt_type}")
             return ""
 
         # Check if we need to reload or if not in cache
         if reload or prompt_type not in self._prompts_cache:
-            filename = prompt_files[prompt_type]
+            filename = _PROMPT_FILES[prompt_type]
             prompts = self._load_prompt_file(filename)
             if prompts:
                 self._prompts_cache[prompt_type] = prompts
@@ -177,14 +194,8 @@ class PromptLoader:
         # Get prompts from cache
         prompts = self._prompts_cache.get(prompt_type, {})
 
-        # Get the requested section using the constructed section_key
-        prompt_text = prompts.get(section_key, '')
-
-        # If not found with constructed key, try fallback to basic section name
-        if not prompt_text and section_key != section.lower():
-            prompt_text = prompts.get(section.lower(), '')
-            if prompt_text:
-                logger.debug(f"Found prompt using fallback section '{section.lower()}' instead of '{section_key}'")
+        # Get the requested section, falling back to the basic section name
+        prompt_text = prompts.get(section_key) or prompts.get(base_key, '')
 
         if not prompt_text:
             logger.warning(
@@ -205,6 +216,8 @@ class PromptLoader:
     def clear_cache(self):
         """Clear the prompts cache"""
         self._prompts_cache.clear()
+        self._parsed_files.clear()
+        self._prompt_mtimes.clear()
         self._cache_loaded = False
         logger.info("Prompts cache cleared")
 
@@ -223,11 +236,8 @@ class PromptLoader:
         }
 
 
-# Global instance - use absolute path relative to project root
-import sys
-
-project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-prompts_path = os.path.join(project_root, "Prompts")
+# Global instance - use absolute path relative to project root (Source/Services/ -> project root)
+prompts_path = str(Path(__file__).resolve().parents[2] / "Prompts")
 
 # This will be replaced by app.state in FastAPI
 _global_prompt_loader = None
@@ -249,7 +259,17 @@ def initialize_prompt_loader() -> PromptLoader:
     return _global_prompt_loader
 
 
+async def initialize_prompt_loader_async() -> PromptLoader:
+    """Initialize and preload prompt loader without blocking the event loop - for use in FastAPI lifespan"""
+    global _global_prompt_loader
+    _global_prompt_loader = PromptLoader(prompts_path)
+    await _global_prompt_loader.preload_all_prompts_async()
+    return _global_prompt_loader
+
+
 if __name__ == "__main__":
+    setup_logging()
+
     # Test the prompt loader - focusing on the new prompts
     loader = PromptLoader(prompts_path)
     loader.preload_all_prompts()
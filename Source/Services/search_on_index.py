@@ -2,23 +2,120 @@
 Advanced Unified Content Search - Advanced search system for unified content
 Supports searching in videos and documents
 """
+import hashlib
 import logging
 import asyncio
-from typing import List, Dict
+import time
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+from typing import List, Dict, Optional, Sequence, Tuple
 from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.search.documents.models import VectorizedQuery
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.models import VectorFilterMode, VectorizedQuery
 from openai import AsyncAzureOpenAI
 import traceback
+import unicodedata
+from Source.Services.shared_clients import get_openai_client, build_aiohttp_transport
+from Source.Services.semantic_cache import SemanticCache
+from Source.Services.embedding_batcher import get_embedding_batcher
 from Config.config import (
-    SEARCH_SERVICE_NAME, SEARCH_API_KEY,
-    AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_VERSION,
-    AZURE_OPENAI_EMBEDDING_MODEL, INDEX_NAME
+    SEARCH_SERVICE_NAME, SEARCH_API_KEY, AZURE_OPENAI_EMBEDDING_MODEL, INDEX_NAME, SEARCH_MAX_CONNECTIONS
 )
-from Config.logging_config import setup_logging
+from Config.logging_config import setup_logging, LOGGER_NAME
 
-# Initialize logger
-logger = setup_logging()
+# Shared application logger (handlers are attached once by setup_logging)
+logger = logging.getLogger(LOGGER_NAME)
+
+# Max number of query embeddings kept in the per-instance LRU cache. Entries are float32
+# arrays (~6 KB for 1536 dims, vs ~50 KB as a list of Python floats)
+EMBEDDING_CACHE_SIZE = 2048
+
+# Vector-leg candidates fused with the text results in hybrid_search. Only the top_k fused
+# documents are returned, but a wider vector leg keeps the fusion ranking stable
+HYBRID_VECTOR_KNN = 50
+
+# Seconds cached search_best_answers results are served (same as the response caches on top)
+SEARCH_CACHE_TTL = 15 * 60
+
+# Process-wide async search clients by index name - every search system on an
+# index shares its connection pool
+_SEARCH_CLIENTS: Dict[str, SearchClient] = {}
+
+# Search projections - every field (for callers that log/display hit metadata),
+# the slim default, and what the RAG pipeline reads from search_best_answers results
+_SELECT_FIELDS = (
+    "id", "content_type", "source_id", "course_id", "chunk_index",
+    "text", "start_time", "end_time", "section_title", "created_date", "keywords", "topics", "file_name"
+)
+_SLIM_FIELDS = ("id", "content_type", "source_id", "course_id", "chunk_index", "text")
+_RAG_FIELDS = _SLIM_FIELDS + ("start_time", "end_time", "section_title")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize query text for exact-match caches - NFKC (unifies presentation forms and
+    full-width characters), whitespace collapsed, casefolded
+    """
+    return " ".join(unicodedata.normalize("NFKC", query).split()).casefold()
+
+
+def request_key(*fields: Optional[str]) -> str:
+    """
+    Short stable digest of a request's scope and normalized query text - the services' in-flight
+    (singleflight) key, so identical concurrent requests share one answer. The query must be the
+    last field
+    """
+    *scope, query = fields
+    text = "\x1f".join([*(field or "" for field in scope), normalize_query(query)])
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+def get_search_client(index_name: str) -> SearchClient:
+    """
+    Get the shared async search client for an index, creating it on first use
+
+    Must be called with a running event loop (the aiohttp session binds to it).
+    Creation is synchronous, so concurrent callers can't race into building two
+    clients. Every AdvancedUnifiedContentSearch on the same index shares the client
+    and its warm connections - don't close it per instance.
+    """
+    client = _SEARCH_CLIENTS.get(index_name)
+    if client is None:
+        client = _SEARCH_CLIENTS[index_name] = SearchClient(
+            endpoint=f"https://{SEARCH_SERVICE_NAME}.search.windows.net",
+            index_name=index_name,
+            credential=AzureKeyCredential(SEARCH_API_KEY),
+            # All requests go to one host - keep a warm pool sized for concurrent searches
+            transport=build_aiohttp_transport(
+                limit=SEARCH_MAX_CONNECTIONS,
+                limit_per_host=SEARCH_MAX_CONNECTIONS,
+                keepalive_timeout=30
+            )
+        )
+        logger.info("Shared Azure Search client created for index: %s", index_name)
+    return client
+
+
+@lru_cache(maxsize=1024)
+def _scope_filter(source_id: Optional[str], course_id: Optional[str]) -> Optional[str]:
+    """
+    The escaped source/course part of an OData filter, cached per (source_id, course_id)
+
+    The same few sources and courses recur across queries and adjacent chunk lookups,
+    so the escaping and formatting is done once per pair
+    """
+    filters = []
+    if source_id:
+        filters.append(f"source_id eq '{AdvancedUnifiedContentSearch._escape(source_id)}'")
+    if course_id:
+        filters.append(f"course_id eq '{AdvancedUnifiedContentSearch._escape(course_id)}'")
+    return " and ".join(filters) or None
+
+
+def _or_na(value):
+    """Display helper - 'N/A' for a missing field"""
+    return 'N/A' if value is None else value
 
 
 class AdvancedUnifiedContentSearch:
@@ -28,83 +125,122 @@ class AdvancedUnifiedContentSearch:
     Allows searching all content together or filtered by type
     """
 
-    def __init__(self, index_name: str = INDEX_NAME):
+    def __init__(self, index_name: str = INDEX_NAME, openai_client: AsyncAzureOpenAI = None):
         self.index_name = INDEX_NAME
-        self.search_endpoint = f"https://{SEARCH_SERVICE_NAME}.search.windows.net"
-        self.credential = AzureKeyCredential(SEARCH_API_KEY)
-
-        # Create search client
-        self.search_client = SearchClient(
-            endpoint=self.search_endpoint,
-            index_name=self.index_name,
-            credential=self.credential
-        )
+        # Async search client (requests don't block the event loop) - one per index per process
+        self.search_client = get_search_client(self.index_name)
+
+        # OpenAI client for vector search - shared with the chat services (one connection pool)
+        self.openai_client = openai_client or get_openai_client()
+        # Cache misses from concurrent requests (Free Chat and Test Myself alike - the
+        # batcher is shared per client) are embedded together in one API call
+        self._embedding_batcher = get_embedding_batcher(self.openai_client)
+
+        # Normalized query text -> embedding, least recently used first
+        self._embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # Normalized query text -> lock held while its embedding is being fetched
+        self._embedding_locks: Dict[str, asyncio.Lock] = {}
+
+        # Final search_best_answers results for paraphrased queries, by (source_id, course_id, k)
+        self._semantic_cache = SemanticCache(ttl=SEARCH_CACHE_TTL)
 
-        # Create OpenAI client for vector search
-        self.openai_client = AsyncAzureOpenAI(
-            api_key=AZURE_OPENAI_API_KEY,
-            api_version=AZURE_OPENAI_API_VERSION,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT
+        logger.info("AdvancedUnifiedContentSearch initialized with index: %s", self.index_name)
+
+    @classmethod
+    async def close(cls):
+        """
+        Close the shared search clients - call once on application shutdown
+        (the OpenAI client is shared too and closed by its owner)
+        """
+        clients = list(_SEARCH_CLIENTS.values())
+        _SEARCH_CLIENTS.clear()
+        for client in clients:
+            await client.close()
+        if clients:
+            logger.info("Shared Azure Search clients closed")
+
+    def invalidate_cache(self, identifier: str) -> int:
+        """Drop cached search results for a course or source (e.g. after it was re-indexed)"""
+        return self._semantic_cache.invalidate(lambda cache_key: identifier in cache_key[:2])
+
+    async def _sample_documents(self) -> Tuple[List[Dict], int]:
+        """Fetch a few sample documents and the total document count"""
+        results = await self.search_client.search(
+            search_text="*",
+            select=["*"],
+            top=5,
+            include_total_count=True
         )
+        docs = [doc async for doc in results]
+        return docs, await results.get_count()
 
-        logger.info(f"AdvancedUnifiedContentSearch initialized with index: {self.index_name}")
+    async def _count_documents(self, filter_expression: str) -> int:
+        """Count documents matching a filter"""
+        results = await self.search_client.search("*", filter=filter_expression, include_total_count=True, top=0)
+        return await results.get_count()
 
-    def check_index_status(self) -> Dict:
+    async def warmup(self):
+        """
+        Open the search and OpenAI connections before the first request (call at startup)
+
+        Runs one minimal search and one embedding call so the TLS handshakes, HTTP/2
+        sessions and pool connections are in place. Failures are only logged - the
+        service still starts and the first request simply pays the cold start
+        """
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            self.search_client.get_document_count(),
+            self.openai_client.embeddings.create(model=AZURE_OPENAI_EMBEDDING_MODEL, input="warmup"),
+            return_exceptions=True
+        )
+        for target, result in zip(("search", "OpenAI"), results):
+            if isinstance(result, Exception):
+                logger.warning("Warmup of %s connection failed: %s", target, result)
+        logger.info("Connection warmup finished in %.2fs", time.perf_counter() - start)
+
+    async def check_index_status(self) -> Dict:
         """Check unified index status and display basic information"""
         logger.info("=" * 60)
 
         try:
-            # General search for testing
-            results = self.search_client.search(
-                search_text="*",
-                select=["*"],
-                top=5,
-                include_total_count=True
+            # General search for testing and counts by content type - independent requests, run concurrently
+            (docs, total_count), video_count, doc_count = await asyncio.gather(
+                self._sample_documents(),
+                self._count_documents("content_type eq 'video'"),
+                self._count_documents("content_type eq 'document'")
             )
 
-            total_count = results.get_count()
-            docs = list(results)
-
-            logger.info(f"Total chunks in unified index: {total_count}")
-            logger.info(f"Documents returned for testing: {len(docs)}")
+            logger.info("Total chunks in unified index: %s", total_count)
+            logger.info("Documents returned for testing: %s", len(docs))
 
             if docs:
-                logger.info(f"Unified index is active and contains data")
+                logger.info("Unified index is active and contains data")
 
-                # Count by content type
-                video_results = self.search_client.search("*", filter="content_type eq 'video'",
-                                                          include_total_count=True, top=0)
-                video_count = video_results.get_count()
-
-                doc_results = self.search_client.search("*", filter="content_type eq 'document'",
-                                                        include_total_count=True, top=0)
-                doc_count = doc_results.get_count()
-
-                logger.info(f"Video chunks: {video_count}")
-                logger.info(f"Document chunks: {doc_count}")
+                logger.info("Video chunks: %s", video_count)
+                logger.info("Document chunks: %s", doc_count)
 
                 # Display document examples
-                logger.info(f"\nDocument examples in index:")
+                logger.info("\nDocument examples in index:")
                 for i, doc in enumerate(docs[:10], 1):
                     content_type = doc.get('content_type', 'unknown')
-                    logger.info(f"\nDocument {i} ({content_type}):")
-                    logger.info(f"  ID: {doc.get('id', 'N/A')}")
-                    logger.info(f"  Source ID: {doc.get('source_id', 'N/A')}")
-                    logger.info(f"  Source Name: {doc.get('source_name', 'N/A')}")
-                    logger.info(f"  Chunk Index: {doc.get('chunk_index', 'N/A')}")
+                    logger.info("\nDocument %s (%s):", i, content_type)
+                    logger.info("  ID: %s", doc.get('id', 'N/A'))
+                    logger.info("  Source ID: %s", doc.get('source_id', 'N/A'))
+                    logger.info("  Source Name: %s", doc.get('source_name', 'N/A'))
+                    logger.info("  Chunk Index: %s", doc.get('chunk_index', 'N/A'))
 
                     if content_type == 'video':
-                        logger.info(f"  Start Time: {doc.get('start_time', 'N/A')}")
-                        logger.info(f"  Start Seconds: {doc.get('start_seconds', 'N/A')}")
+                        logger.info("  Start Time: %s", doc.get('start_time', 'N/A'))
+                        logger.info("  Start Seconds: %s", doc.get('start_seconds', 'N/A'))
                     elif content_type == 'document':
-                        logger.info(f"  Section Title: {doc.get('section_title', 'N/A')}")
-                        logger.info(f"  Document Type: {doc.get('document_type', 'N/A')}")
+                        logger.info("  Section Title: %s", doc.get('section_title', 'N/A'))
+                        logger.info("  Document Type: %s", doc.get('document_type', 'N/A'))
 
                     # Display text content
                     text = doc.get('text', '')
                     if text:
                         preview = text[:150] + "..." if len(text) > 150 else text
-                        logger.info(f"  Content: {preview}")
+                        logger.info("  Content: %s", preview)
                     logger.info("-" * 30)
 
                 return {
@@ -119,214 +255,203 @@ class AdvancedUnifiedContentSearch:
                 return {"status": "empty", "total_chunks": 0}
 
         except Exception as e:
-            logger.info(f"Error accessing index: {e}")
-            logger.error(f"Error checking index status: {e}")
+            logger.info("Error accessing index: %s", e)
+            logger.error("Error checking index status: %s", e)
             return {"status": "error", "error": str(e)}
 
     async def generate_query_embedding(self, query: str) -> List[float]:
-        """Generate embedding for search query"""
+        """
+        Generate embedding for search query
+
+        Repeat queries are served from an LRU cache, and concurrent requests for the
+        same query share a single embeddings API call. Misses for different queries
+        arriving within a few milliseconds are batched into one call
+        """
+        cache_key = normalize_query(query)
+        embedding = self._embedding_cache.get(cache_key)
+        if embedding is not None:
+            self._embedding_cache.move_to_end(cache_key)
+            return embedding.tolist()
+
+        lock = self._embedding_locks.setdefault(cache_key, asyncio.Lock())
         try:
-            response = await self.openai_client.embeddings.create(
-                model=AZURE_OPENAI_EMBEDDING_MODEL,
-                input=query
-            )
-            return response.data[0].embedding
+            async with lock:
+                # A concurrent request for the same query may have filled the cache meanwhile
+                embedding = self._embedding_cache.get(cache_key)
+                if embedding is not None:
+                    self._embedding_cache.move_to_end(cache_key)
+                    return embedding.tolist()
+
+                embedding = await self._embedding_batcher.embed(query)
+
+                self._embedding_cache[cache_key] = np.asarray(embedding, dtype=np.float32)
+                if len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                    self._embedding_cache.popitem(last=False)
+
+                return embedding
         except Exception as e:
-            logger.error(f"Error generating query embedding: {e}")
+            logger.error("Error generating query embedding: %s", e)
             return []
+        finally:
+            # Waiters keep their own reference to the lock; later requests hit the cache
+            if not lock.locked():
+                self._embedding_locks.pop(cache_key, None)
+
+    async def generate_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for several queries with a single embeddings API call
+
+        Cached queries are served from the LRU cache; only the rest are sent (in one request).
+        Returns one embedding per query, in order ([] for a query whose embedding failed)
+        """
+        cache_keys = [normalize_query(query) for query in queries]
+        embeddings = [self._embedding_cache.get(key) for key in cache_keys]
+        embeddings = [None if embedding is None else embedding.tolist() for embedding in embeddings]
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            try:
+                response = await self.openai_client.embeddings.create(
+                    model=AZURE_OPENAI_EMBEDDING_MODEL,
+                    input=[queries[i] for i in missing]
+                )
+                # response.data is in input order
+                for i, item in zip(missing, response.data):
+                    embeddings[i] = item.embedding
+                    self._embedding_cache[cache_keys[i]] = np.asarray(item.embedding, dtype=np.float32)
+                while len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                    self._embedding_cache.popitem(last=False)
+            except Exception as e:
+                logger.error("Error generating query embeddings: %s", e)
+
+        return [embedding or [] for embedding in embeddings]
+
+    async def simple_text_search(self, query: str, top_k: int = 5, source_id: str = None, course_id: str = None,
+                                 fields: Optional[Sequence[str]] = None, session_id: str = None) -> List[Dict]:
+        """
+        Simple text search when embedding cannot be extracted
 
-    async def simple_text_search(self, query: str, top_k: int = 5, source_id: str = None, course_id: str = None) -> List[Dict]:
-        """Simple text search when embedding cannot be extracted"""
+        fields is the select projection (default _SLIM_FIELDS) - here and in the other search methods.
+        session_id (e.g. the conversation id) pins a conversation's queries to one search
+        replica, so its warm caches and scoring state are reused
+        """
         logger.info("=" * 60)
 
         try:
             search_params = {
                 "search_text": query,
-                "select": [
-                    "id", "content_type", "source_id", "course_id", "chunk_index",
-                    "text", "start_time", "end_time", "section_title", "created_date", "keywords", "topics", "file_name"
-                ],
+                "select": fields or _SLIM_FIELDS,
                 "top": top_k,
                 "include_total_count": True
             }
 
             # Add filters
-            filters = []
-            if source_id:
-                escaped_source_id = source_id.replace("'", "''")
-                filters.append(f"source_id eq '{escaped_source_id}'")
-            if course_id:
-                escaped_course_id = course_id.replace("'", "''")
-                filters.append(f"course_id eq '{escaped_course_id}'")
+            search_filter = self._build_filter(source_id, course_id)
+            if search_filter:
+                search_params["filter"] = search_filter
+            self._add_session(search_params, session_id)
 
-            if filters:
-                search_params["filter"] = " and ".join(filters)
+            results = await self.search_client.search(**search_params)
 
-            results = self.search_client.search(**search_params)
-
-            docs = list(results)
-            total_count = results.get_count()
+            docs = [doc async for doc in results]
+            total_count = await results.get_count()
 
             if not docs:
                 logger.info("No results found")
                 return []
 
             filter_msg = self._build_filter_message(source_id, course_id)
-            logger.info(f"Found {len(docs)} results out of {total_count} chunks{filter_msg}:")
-
-            for i, doc in enumerate(docs, 1):
-                score = doc.get('@search.score', 0)
-                content_type_doc = doc.get('content_type', 'unknown')
-                logger.info(f"\nResult {i} ({content_type_doc}, score: {score:.3f}):")
-                logger.info(f"  ID: {doc.get('id', 'N/A')}")
-                logger.info(f"  Source ID: {doc.get('source_id', 'N/A')}")
-                logger.info(f"  Course ID: {doc.get('course_id', 'N/A')}")
-                logger.info(f"  Chunk: {doc.get('chunk_index', 'N/A')}")
-                logger.info(f"  Created: {doc.get('created_date', 'N/A')}")
-
-                if content_type_doc == 'video':
-                    start_time = doc.get('start_time', '')
-                    end_time = doc.get('end_time', '')
-                    if start_time:
-                        logger.info(f"  Time: {start_time} - {end_time}")
-                    keywords = doc.get('keywords', '')
-                    if keywords:
-                        logger.info(f"  Keywords: {keywords}")
-                    topics = doc.get('topics', '')
-                    if topics:
-                        logger.info(f"  Topics: {topics}")
-                elif content_type_doc == 'document':
-                    section_title = doc.get('section_title', '')
-                    if section_title:
-                        logger.info(f"  Section Title: {section_title}")
-
-                # Display file name if available
-                file_name = doc.get('file_name', '')
-                if file_name:
-                    logger.info(f"  File Name: {file_name}")
-
-                text = doc.get('text', '')
-                if text:
-                    preview = text[:200] + "..." if len(text) > 200 else text
-                    logger.info(f"  Content: {preview}")
-
-                logger.info("—" * 40)
+            logger.info("Found %s results out of %s chunks%s:", len(docs), total_count, filter_msg)
+
+            if logger.isEnabledFor(logging.INFO):
+                for i, doc in enumerate(docs, 1):
+                    self._log_result(i, doc, "score")
 
             return docs
 
         except Exception as e:
-            logger.info(f"Error in text search: {e}")
-            logger.error(f"Error in text search: {e}")
+            logger.info("Error in text search: %s", e)
+            logger.error("Error in text search: %s", e)
             return []
 
-    async def hybrid_search(self, query: str, top_k: int = 5, source_id: str = None, course_id: str = None) -> List[Dict]:
-        """Hybrid search - combines text and vector"""
+    async def hybrid_search(self, query: str, top_k: int = 5, source_id: str = None, course_id: str = None,
+                            fields: Optional[Sequence[str]] = None, query_vector: List[float] = None,
+                            session_id: str = None) -> List[Dict]:
+        """Hybrid search - combines text and vector (query_vector skips the embedding call, as in semantic_search)"""
         logger.info("=" * 60)
 
         try:
-            # Generate embedding for query
-            query_vector = await self.generate_query_embedding(query)
+            # Generate embedding for query (unless precomputed)
+            if not query_vector:
+                query_vector = await self.generate_query_embedding(query)
             if not query_vector:
                 logger.info("Cannot generate embedding, performing text search only")
-                return await self.simple_text_search(query, top_k, source_id, course_id)
+                return await self.simple_text_search(query, top_k, source_id, course_id, fields, session_id)
 
             search_params = {
                 "search_text": query,
                 "vector_queries": [VectorizedQuery(
                     vector=query_vector,
-                    k_nearest_neighbors=50,
+                    k_nearest_neighbors=HYBRID_VECTOR_KNN,
                     fields="vector"
                 )],
-                "select": [
-                    "id", "content_type", "source_id", "course_id", "chunk_index",
-                    "text", "start_time", "end_time", "section_title", "created_date", "keywords", "topics", "file_name"
-                ],
-                "top": 50,
+                "select": fields or _SLIM_FIELDS,
+                "top": top_k,
                 "include_total_count": True
             }
 
             # Add filters
-            filters = []
-            if source_id:
-                escaped_source_id = source_id.replace("'", "''")
-                filters.append(f"source_id eq '{escaped_source_id}'")
-            if course_id:
-                escaped_course_id = course_id.replace("'", "''")
-                filters.append(f"course_id eq '{escaped_course_id}'")
+            search_filter = self._build_filter(source_id, course_id)
+            if search_filter:
+                search_params["filter"] = search_filter
+                # Restrict the vector (HNSW) search to the course/source before ranking, so the
+                # nearest neighbours aren't spent on other courses and then filtered out
+                search_params["vector_filter_mode"] = VectorFilterMode.PRE_FILTER
+            self._add_session(search_params, session_id)
 
-            if filters:
-                search_params["filter"] = " and ".join(filters)
+            results = await self.search_client.search(**search_params)
 
-            results = self.search_client.search(**search_params)
+            # The count comes with the first page - read it before iterating
+            total_count = await results.get_count()
 
-            docs = list(results)
-            total_count = results.get_count()
+            docs = [doc async for doc in results]
 
             if not docs:
                 logger.info("No hybrid results found")
                 return []
 
-            # Slice to requested top_k for display and return
-            docs = docs[:top_k]
-
             filter_msg = self._build_filter_message(source_id, course_id)
-            logger.info(f"Found {len(docs)} hybrid results out of {total_count} chunks{filter_msg}:")
-
-            for i, doc in enumerate(docs, 1):
-                score = doc.get('@search.score', 0)
-                content_type_doc = doc.get('content_type', 'unknown')
-                logger.info(f"\nResult {i} ({content_type_doc}, combined score: {score:.3f}):")
-                logger.info(f"  ID: {doc.get('id', 'N/A')}")
-                logger.info(f"  Source ID: {doc.get('source_id', 'N/A')}")
-                logger.info(f"  Course ID: {doc.get('course_id', 'N/A')}")
-                logger.info(f"  Chunk: {doc.get('chunk_index', 'N/A')}")
-                logger.info(f"  Created: {doc.get('created_date', 'N/A')}")
-
-                if content_type_doc == 'video':
-                    start_time = doc.get('start_time', '')
-                    end_time = doc.get('end_time', '')
-                    if start_time:
-                        logger.info(f"  Time: {start_time} - {end_time}")
-                    keywords = doc.get('keywords', '')
-                    if keywords:
-                        logger.info(f"  Keywords: {keywords}")
-                    topics = doc.get('topics', '')
-                    if topics:
-                        logger.info(f"  Topics: {topics}")
-                elif content_type_doc == 'document':
-                    section_title = doc.get('section_title', '')
-                    if section_title:
-                        logger.info(f"  Section Title: {section_title}")
-
-                # Display file name if available
-                file_name = doc.get('file_name', '')
-                if file_name:
-                    logger.info(f"  File Name: {file_name}")
-
-                text = doc.get('text', '')
-                if text:
-                    preview = text[:200] + "..." if len(text) > 200 else text
-                    logger.info(f"  Content: {preview}")
-
-                logger.info("—" * 40)
+            logger.info("Found %s hybrid results out of %s chunks%s:", len(docs), total_count, filter_msg)
+
+            if logger.isEnabledFor(logging.INFO):
+                for i, doc in enumerate(docs, 1):
+                    self._log_result(i, doc, "combined score")
 
             return docs
 
         except Exception as e:
-            logger.info(f"Error in hybrid search: {e}")
-            logger.error(f"Error in hybrid search: {e}")
+            logger.info("Error in hybrid search: %s", e)
+            logger.error("Error in hybrid search: %s", e)
             return []
 
-    async def semantic_search(self, query: str, top_k: int = 5, source_id: str = None, course_id: str = None) -> List[Dict]:
-        """Advanced semantic search"""
+    async def semantic_search(self, query: str, top_k: int = 5, source_id: str = None, course_id: str = None,
+                              query_vector: List[float] = None, fields: Optional[Sequence[str]] = None,
+                              session_id: str = None) -> List[Dict]:
+        """
+        Advanced semantic search
+
+        query_vector can be passed when the query was already embedded (e.g. in a
+        generate_query_embeddings batch) to skip the embedding call
+        """
         logger.info("=" * 60)
 
         try:
-            # Generate embedding for query
-            query_vector = await self.generate_query_embedding(query)
+            # Generate embedding for query (unless precomputed)
+            if not query_vector:
+                query_vector = await self.generate_query_embedding(query)
             if not query_vector:
                 logger.info("Cannot generate embedding, performing text search only")
-                return await self.simple_text_search(query, top_k, source_id, course_id)
+                return await self.simple_text_search(query, top_k, source_id, course_id, fields, session_id)
 
             # Prepare search parameters
             search_params = {
@@ -340,89 +465,49 @@ class AdvancedUnifiedContentSearch:
                     k_nearest_neighbors=top_k,
                     fields="vector"
                 )],
-                "select": [
-                    "id", "content_type", "source_id", "course_id", "chunk_index",
-                    "text", "start_time", "end_time", "section_title", "created_date", "keywords", "topics", "file_name"
-                ],
+                "select": fields or _SLIM_FIELDS,
                 "top": top_k
             }
 
             # Add filters
-            filters = []
-            if source_id:
-                escaped_source_id = source_id.replace("'", "''")
-                filters.append(f"source_id eq '{escaped_source_id}'")
-            if course_id:
-                escaped_course_id = course_id.replace("'", "''")
-                filters.append(f"course_id eq '{escaped_course_id}'")
-
-            if filters:
-                search_params["filter"] = " and ".join(filters)
+            search_filter = self._build_filter(source_id, course_id)
+            if search_filter:
+                search_params["filter"] = search_filter
+                # Filter before the vector search, as in hybrid_search
+                search_params["vector_filter_mode"] = VectorFilterMode.PRE_FILTER
+            self._add_session(search_params, session_id)
 
             # Advanced semantic search
-            results = self.search_client.search(**search_params)
+            results = await self.search_client.search(**search_params)
 
-            docs = list(results)
+            docs = [doc async for doc in results]
 
             if not docs:
                 logger.info("No semantic results found")
                 return []
 
             filter_msg = self._build_filter_message(source_id, course_id)
-            logger.info(f"Found {len(docs)} semantic results{filter_msg}:")
-
-            for i, doc in enumerate(docs, 1):
-                score = doc.get('@search.score', 0)
-                content_type_doc = doc.get('content_type', 'unknown')
-                logger.info(f"\nResult {i} ({content_type_doc}, semantic score: {score:.3f}):")
-                logger.info(f"  ID: {doc.get('id', 'N/A')}")
-                logger.info(f"  Source ID: {doc.get('source_id', 'N/A')}")
-                logger.info(f"  Course ID: {doc.get('course_id', 'N/A')}")
-                logger.info(f"  Chunk: {doc.get('chunk_index', 'N/A')}")
-                logger.info(f"  Created: {doc.get('created_date', 'N/A')}")
-
-                if content_type_doc == 'video':
-                    start_time = doc.get('start_time', '')
-                    end_time = doc.get('end_time', '')
-                    if start_time:
-                        logger.info(f"  Time: {start_time} - {end_time}")
-                    keywords = doc.get('keywords', '')
-                    if keywords:
-                        logger.info(f"  Keywords: {keywords}")
-                    topics = doc.get('topics', '')
-                    if topics:
-                        logger.info(f"  Topics: {topics}")
-                elif content_type_doc == 'document':
-                    section_title = doc.get('section_title', '')
-                    if section_title:
-                        logger.info(f"  Section Title: {section_title}")
-
-                # Display file name if available
-                file_name = doc.get('file_name', '')
-                if file_name:
-                    logger.info(f"  File Name: {file_name}")
-
-                text = doc.get('text', '')
-                if text:
-                    preview = text[:200] + "..." if len(text) > 200 else text
-                    logger.info(f"  Content: {preview}")
-
-                logger.info("—" * 40)
+            logger.info("Found %s semantic results%s:", len(docs), filter_msg)
+
+            if logger.isEnabledFor(logging.INFO):
+                for i, doc in enumerate(docs, 1):
+                    self._log_result(i, doc, "semantic score")
 
             return docs
 
         except Exception as e:
-            logger.info(f"Error in advanced semantic search: {e}")
-            logger.error(f"Error in semantic search: {e}")
-            # Fallback to regular hybrid search
-            return await self.hybrid_search(query, top_k, source_id, course_id)
+            logger.info("Error in advanced semantic search: %s", e)
+            logger.error("Error in semantic search: %s", e)
+            # Fallback to regular hybrid search (reusing the embedding, if we got one)
+            return await self.hybrid_search(query, top_k, source_id, course_id, fields, query_vector, session_id)
 
-    async def get_adjacent_chunks(self, chunk: Dict) -> List[Dict]:
+    async def get_adjacent_chunks(self, chunk: Dict, fields: Optional[Sequence[str]] = None) -> List[Dict]:
         """
         Get adjacent chunks (before and after) for a given chunk
 
         Args:
             chunk: The original chunk to find adjacent chunks for
+            fields: Fields to return for each adjacent chunk (default _SLIM_FIELDS)
 
         Returns:
             List of adjacent chunks (before and after the original chunk)
@@ -433,63 +518,102 @@ class AdvancedUnifiedContentSearch:
             chunk_index = chunk.get('chunk_index')
 
             if not all([source_id, course_id, chunk_index is not None]):
-                logger.warning(f"Missing required fields for adjacent chunk search: source_id={source_id}, course_id={course_id}, chunk_index={chunk_index}")
+                logger.warning("Missing required fields for adjacent chunk search: source_id=%s, course_id=%s, "
+                               "chunk_index=%s", source_id, course_id, chunk_index)
                 return []
 
-            adjacent_chunks = []
+            # Fetch the chunks before and after in a single request
+            neighbor_indexes = [chunk_index + 1] if chunk_index == 0 else [chunk_index - 1, chunk_index + 1]
+            index_filter = " or ".join(f"chunk_index eq {i}" for i in neighbor_indexes)
+            adjacent_filter = self._build_filter(source_id, course_id, f"({index_filter})")
 
-            # Search for chunk before (chunk_index - 1)
-            if chunk_index > 0:
-                try:
-                    escaped_source_id = source_id.replace("'", "''")
-                    escaped_course_id = course_id.replace("'", "''")
-                    before_filter = f"source_id eq '{escaped_source_id}' and course_id eq '{escaped_course_id}' and chunk_index eq {chunk_index - 1}"
-                    before_results = self.search_client.search(
-                        search_text="*",
-                        filter=before_filter,
-                        select=[
-                            "id", "content_type", "source_id", "course_id", "chunk_index",
-                            "text", "start_time", "end_time", "section_title", "created_date", "keywords", "topics", "file_name"
-                        ],
-                        top=1
-                    )
-                    before_docs = list(before_results)
-                    if before_docs:
-                        adjacent_chunks.extend(before_docs)
-                        logger.info(f"Found chunk before: {chunk_index - 1}")
-                except Exception as e:
-                    logger.warning(f"Error searching for chunk before {chunk_index}: {e}")
-
-            # Search for chunk after (chunk_index + 1)
             try:
-                escaped_source_id = source_id.replace("'", "''")
-                escaped_course_id = course_id.replace("'", "''")
-                after_filter = f"source_id eq '{escaped_source_id}' and course_id eq '{escaped_course_id}' and chunk_index eq {chunk_index + 1}"
-                after_results = self.search_client.search(
+                results = await self.search_client.search(
                     search_text="*",
-                    filter=after_filter,
-                    select=[
-                        "id", "content_type", "source_id", "course_id", "chunk_index",
-                        "text", "start_time", "end_time", "section_title", "created_date", "keywords", "topics", "file_name"
-                    ],
-                    top=1
+                    filter=adjacent_filter,
+                    select=fields or _SLIM_FIELDS,
+                    top=len(neighbor_indexes)
                 )
-                after_docs = list(after_results)
-                if after_docs:
-                    adjacent_chunks.extend(after_docs)
-                    logger.info(f"Found chunk after: {chunk_index + 1}")
+                # Keep before-then-after order regardless of the order the service returns them in
+                adjacent_chunks = sorted([doc async for doc in results], key=lambda doc: doc.get('chunk_index', 0))
             except Exception as e:
-                logger.warning(f"Error searching for chunk after {chunk_index}: {e}")
+                logger.warning("Error searching for chunks adjacent to %s: %s", chunk_index, e)
+                adjacent_chunks = []
 
-            logger.debug(f"Found {len(adjacent_chunks)} adjacent chunks for chunk {chunk_index}")
+            logger.debug("Found %s adjacent chunks for chunk %s", len(adjacent_chunks), chunk_index)
             return adjacent_chunks
 
         except Exception as e:
-            logger.error(f"Error getting adjacent chunks: {e}")
+            logger.error("Error getting adjacent chunks: %s", e)
             return []
 
 
-    async def search_best_answers(self, query: str, k: int = 5, source_id: str = None, course_id: str = None) -> List[Dict]:
+    async def get_adjacent_chunks_batch(self, chunks: List[Dict],
+                                        fields: Optional[Sequence[str]] = None) -> List[List[Dict]]:
+        """
+        Get adjacent chunks (before and after) for several chunks with a single search request
+
+        Args:
+            chunks: The original chunks to find adjacent chunks for
+            fields: Fields to return for each adjacent chunk (default _SLIM_FIELDS)
+
+        Returns:
+            One list of adjacent chunks (before, after) per input chunk, in input order
+        """
+        # (source_id, course_id) -> chunk indexes to fetch
+        wanted: Dict[Tuple[str, str], set] = {}
+        for chunk in chunks:
+            source_id = chunk.get('source_id')
+            course_id = chunk.get('course_id')
+            chunk_index = chunk.get('chunk_index')
+            if not all([source_id, course_id, chunk_index is not None]):
+                continue
+            indexes = wanted.setdefault((source_id, course_id), set())
+            if chunk_index > 0:
+                indexes.add(chunk_index - 1)
+            indexes.add(chunk_index + 1)
+
+        if not wanted:
+            return [[] for _ in chunks]
+
+        group_filters = []
+        for (source_id, course_id), indexes in wanted.items():
+            # search.in() only applies to string fields - chunk_index is numeric, so OR the values
+            index_filter = " or ".join(f"chunk_index eq {i}" for i in sorted(indexes))
+            group_filter = self._build_filter(source_id, course_id, f"({index_filter})")
+            group_filters.append(f"({group_filter})")
+
+        try:
+            results = await self.search_client.search(
+                search_text="*",
+                filter=" or ".join(group_filters),
+                select=fields or _SLIM_FIELDS,
+                top=sum(len(indexes) for indexes in wanted.values())
+            )
+            found = {(doc.get('source_id'), doc.get('course_id'), doc.get('chunk_index')): doc async for doc in results}
+        except Exception as e:
+            # E.g. the combined filter was rejected - fall back to one request per chunk, run concurrently
+            logger.warning("Batched adjacent chunk search failed, querying per chunk: %s", e)
+            return list(await asyncio.gather(*(self.get_adjacent_chunks(chunk, fields) for chunk in chunks)))
+
+        logger.debug("Found %s adjacent chunks for %s chunks", len(found), len(chunks))
+
+        adjacent_lists = []
+        for chunk in chunks:
+            source_id = chunk.get('source_id')
+            course_id = chunk.get('course_id')
+            chunk_index = chunk.get('chunk_index')
+            if chunk_index is None:
+                adjacent_lists.append([])
+                continue
+            adjacent_lists.append([
+                found[key] for key in ((source_id, course_id, chunk_index - 1), (source_id, course_id, chunk_index + 1))
+                if key in found
+            ])
+        return adjacent_lists
+
+    async def search_best_answers(self, query: str, k: int = 5, source_id: str = None, course_id: str = None,
+                                  query_vector: List[float] = None, session_id: str = None) -> List[Dict]:
         """
         Enhanced function that receives a question and returns K best answers WITH adjacent chunks
         For each of the top K chunks found, also retrieves the chunk before and after it
@@ -500,57 +624,134 @@ class AdvancedUnifiedContentSearch:
             k: Number of best results to return
             source_id: Optional - if specified, will search only in this specific source
             course_id: Optional - if specified, will search only in this specific course
+            query_vector: Optional - precomputed query embedding (e.g. from generate_query_embeddings)
+            session_id: Optional - stable per-conversation id for search replica affinity
 
         Returns:
             List of chunks including original results and their adjacent chunks
         """
         try:
+            # Step 0: Embed the query once - the vector is reused by every search path below.
+            # Serve paraphrases of recent queries (same filters) from the semantic cache
+            if not query_vector:
+                query_vector = await self.generate_query_embedding(query)
+            cache_key = (source_id, course_id, k)
+            unit_vector = self._semantic_cache.normalize(query_vector) if query_vector else None
+            if unit_vector is not None:
+                cached_results = self._semantic_cache.get(unit_vector, cache_key)
+                if cached_results is not None:
+                    logger.info("Semantic cache hit")
+                    return cached_results
+
             # Step 1: Get the top K semantic search results
-            logger.info(f"Searching for top {k} chunks for query: {query}")
+            logger.info("Searching for top %s chunks", k)
             try:
-                original_results = await self.semantic_search(query, k, source_id, course_id)
+                original_results = await self.semantic_search(query, k, source_id, course_id,
+                                                              query_vector=query_vector, fields=_RAG_FIELDS,
+                                                              session_id=session_id)
             except Exception:
                 # fallback to hybrid if semantic fails
-                original_results = await self.hybrid_search(query, k, source_id, course_id)
+                original_results = await self.hybrid_search(query, k, source_id, course_id, _RAG_FIELDS,
+                                                            query_vector, session_id)
 
             if not original_results:
                 logger.warning("No original results found")
                 return []
 
-            # Step 2: For each result, get adjacent chunks
-            all_chunks = []
-            seen_chunk_ids = set()  # To avoid duplicates
-
-            for i, chunk in enumerate(original_results):
-                # Add the original chunk first
-                chunk_id = chunk.get('id')
-                if chunk_id and chunk_id not in seen_chunk_ids:
-                    all_chunks.append(chunk)
-                    seen_chunk_ids.add(chunk_id)
-                    logger.debug(f"Added original chunk {i+1}: {chunk.get('source_id')}-{chunk.get('chunk_index')}")
+            # Step 2: Get the adjacent chunks of all results (one request for all of them)
+            adjacent_lists = await self.get_adjacent_chunks_batch(original_results, _RAG_FIELDS)
 
-                # Get and add adjacent chunks
-                adjacent_chunks = await self.get_adjacent_chunks(chunk)
+            # Each original chunk followed by its neighbours, deduplicated by id in one
+            # insertion-ordered dict. First occurrence wins, so a chunk that is both a hit
+            # and another hit's neighbour keeps its real search score
+            merged: Dict[str, Dict] = {}
+            for chunk, adjacent_chunks in zip(original_results, adjacent_lists):
+                merged.setdefault(chunk.get('id'), chunk)
                 for adj_chunk in adjacent_chunks:
-                    adj_chunk_id = adj_chunk.get('id')
-                    if adj_chunk_id and adj_chunk_id not in seen_chunk_ids:
-                        all_chunks.append(adj_chunk)
-                        seen_chunk_ids.add(adj_chunk_id)
-                        logger.debug(f"Added adjacent chunk: {adj_chunk.get('source_id')}-{adj_chunk.get('chunk_index')}")
+                    merged.setdefault(adj_chunk.get('id'), adj_chunk)
+            merged.pop(None, None)  # Chunks without an id are dropped
+            all_chunks = list(merged.values())
+
+            if logger.isEnabledFor(logging.DEBUG):
+                for chunk in all_chunks:
+                    logger.debug("Added chunk: %s-%s", chunk.get('source_id'), chunk.get('chunk_index'))
 
-            logger.info(f"Total chunks retrieved: {len(all_chunks)} (original: {len(original_results)}, with adjacent: {len(all_chunks) - len(original_results)})")
+            logger.info("Total chunks retrieved: %s (original: %s, with adjacent: %s)",
+                        len(all_chunks), len(original_results), len(all_chunks) - len(original_results))
+
+            if unit_vector is not None:
+                self._semantic_cache.put(unit_vector, cache_key, all_chunks)
             return all_chunks
 
         except Exception as e:
-            logger.error(f"Error in search_best_answers: {e}")
+            logger.error("Error in search_best_answers: %s", e)
             # Fallback to original search without context
             try:
-                results = await self.semantic_search(query, k, source_id, course_id)
+                results = await self.semantic_search(query, k, source_id, course_id,
+                                                     query_vector=query_vector, fields=_RAG_FIELDS,
+                                                     session_id=session_id)
                 return results
             except Exception:
-                results = await self.hybrid_search(query, k, source_id, course_id)
+                results = await self.hybrid_search(query, k, source_id, course_id, _RAG_FIELDS,
+                                                   query_vector, session_id)
                 return results
 
+    @staticmethod
+    def _log_result(i: int, doc: Dict, score_label: str = "score") -> None:
+        """Log one search hit (callers skip this entirely when INFO logging is off)"""
+        # One pass over the projection - absent fields (slim projections) come back as None
+        (doc_id, content_type_doc, source_id, course_id, chunk_index, text, start_time, end_time,
+         section_title, created_date, keywords, topics, file_name) = map(doc.get, _SELECT_FIELDS)
+        content_type_doc = content_type_doc or 'unknown'
+
+        logger.info("\nResult %s (%s, %s: %.3f):", i, content_type_doc, score_label, doc.get('@search.score', 0))
+        logger.info("  ID: %s", _or_na(doc_id))
+        logger.info("  Source ID: %s", _or_na(source_id))
+        logger.info("  Course ID: %s", _or_na(course_id))
+        logger.info("  Chunk: %s", _or_na(chunk_index))
+        logger.info("  Created: %s", _or_na(created_date))
+
+        if content_type_doc == 'video':
+            if start_time:
+                logger.info("  Time: %s - %s", start_time, end_time or '')
+            if keywords:
+                logger.info("  Keywords: %s", keywords)
+            if topics:
+                logger.info("  Topics: %s", topics)
+        elif content_type_doc == 'document':
+            if section_title:
+                logger.info("  Section Title: %s", section_title)
+
+        # Display file name if available
+        if file_name:
+            logger.info("  File Name: %s", file_name)
+
+        if text:
+            preview = text[:200] + "..." if len(text) > 200 else text
+            logger.info("  Content: %s", preview)
+
+        logger.info("—" * 40)
+
+    @staticmethod
+    def _add_session(search_params: Dict, session_id: Optional[str]) -> None:
+        """Add a sticky session id to search parameters (the service rejects ids starting with '_')"""
+        session_id = (session_id or '').lstrip('_')
+        if session_id:
+            search_params["session_id"] = session_id
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        """Escape a value for use inside a single-quoted OData string literal"""
+        return value.replace("'", "''")
+
+    @staticmethod
+    def _build_filter(source_id: str = None, course_id: str = None, extra: str = None) -> Optional[str]:
+        """Build the OData filter for the source/course restrictions plus an optional extra clause"""
+        scope_filter = _scope_filter(source_id, course_id)
+        if scope_filter and extra:
+            return f"{scope_filter} and {extra}"
+        return scope_filter or extra or None
+
     def _build_filter_message(self, source_id: str = None, course_id: str = None) -> str:
         """Build filter message for display"""
         filter_parts = []
@@ -568,13 +769,14 @@ async def run_unified_search_demo():
     logger.info("Advanced unified content search system - videos and documents")
     logger.info("=" * 80)
 
+    search_system = None
     try:
         # Create search system
         search_system = AdvancedUnifiedContentSearch("unified-content-chunks")
 
         # Check index status
         logger.info("\nChecking unified index status:")
-        status = search_system.check_index_status()
+        status = await search_system.check_index_status()
 
         if status.get("status") != "active":
             logger.info("Index is not active or empty. Please ensure the index is created and contains data.")
@@ -587,60 +789,78 @@ async def run_unified_search_demo():
             "איך אפשר לשלול ביטוי"
         ]
 
-        logger.info(f"\nRunning demo with {len(demo_queries)} queries:")
+        logger.info("\nRunning demo with %s queries:", len(demo_queries))
+
+        # Embed all demo queries in one request (also primes the embedding cache)
+        query_vectors = await search_system.generate_query_embeddings(demo_queries)
 
-        for i, query in enumerate(demo_queries, 1):
-            logger.info(f"\n{'=' * 80}")
-            logger.info(f"Query {i} of {len(demo_queries)}: '{query}'")
-            logger.info(f"{'=' * 80}")
+        # 1. Search all content with enhanced context (adjacent chunks) - queries run
+        # concurrently, bounded so a longer query list stays within the search service limits
+        semaphore = asyncio.Semaphore(4)
+
+        async def run_query(query: str, query_vector: List[float]) -> List[Dict]:
+            async with semaphore:
+                return await search_system.search_best_answers(query, k=5, query_vector=query_vector,
+                                                               session_id="search-demo")
+
+        results_list = await asyncio.gather(
+            *(run_query(query, query_vector) for query, query_vector in zip(demo_queries, query_vectors))
+        )
 
+        # Per-query summaries are logged afterwards, in order, so they don't interleave
+        for i, (query, results) in enumerate(zip(demo_queries, results_list), 1):
+            logger.info("\n%s", '=' * 80)
+            logger.info("Query %s of %s: '%s'", i, len(demo_queries), query)
+            logger.info("%s", '=' * 80)
 
-            # 1. Search all content with enhanced context (adjacent chunks)
-            logger.info(f"\n1. Enhanced search all content (videos + documents) with adjacent chunks:")
+            logger.info("\n1. Enhanced search all content (videos + documents) with adjacent chunks:")
             logger.info("-" * 70)
-            results = await search_system.search_best_answers(query, k=5)
-            logger.info(f"Enhanced search returned {len(results)} total chunks")
+            logger.info("Enhanced search returned %s total chunks", len(results))
 
             logger.info("\n" + "=" * 80)
 
             # # 2. Search specific video with enhanced context
-            # logger.info(f"\n2. Enhanced search specific video with adjacent chunks:")
+            # logger.info("\n2. Enhanced search specific video with adjacent chunks:")
             # logger.info("-" * 60)
             # # Assume we have a video with this ID (you'll need to replace with real ID)
             # sample_video_id = "13"
-            # logger.info(f"Search in video: {sample_video_id}")
+            # logger.info("Search in video: %s", sample_video_id)
             # results = await search_system.search_best_answers(query, k=5, source_id=sample_video_id)
-            # logger.info(f"Enhanced search returned {len(results)} total chunks")
+            # logger.info("Enhanced search returned %s total chunks", len(results))
             #
             # logger.info("\n" + "=" * 80)
             #
             # # 3. Search specific course with enhanced context
-            # logger.info(f"\n3. Enhanced search specific course with adjacent chunks:")
+            # logger.info("\n3. Enhanced search specific course with adjacent chunks:")
             # logger.info("-" * 60)
             # sample_course_id = "Discrete_mathematics"
-            # logger.info(f"Search in course: {sample_course_id}")
+            # logger.info("Search in course: %s", sample_course_id)
             # results = await search_system.search_best_answers(query, k=5, course_id=sample_course_id)
-            # logger.info(f"Enhanced search returned {len(results)} total chunks")
+            # logger.info("Enhanced search returned %s total chunks", len(results))
 
 
             # Break between queries
             if i < len(demo_queries):
                 logger.info("\n" + "Moving to next query..." + "\n")
 
-        logger.info(f"\nDemo completed successfully!")
+        logger.info("\nDemo completed successfully!")
 
     except Exception as e:
-        logger.info(f"Error running demo: {e}")
-        logger.error(f"Error in demo: {e}")
+        logger.info("Error running demo: %s", e)
+        logger.error("Error in demo: %s", e)
         traceback.print_exc()
+    finally:
+        if search_system is not None:
+            await search_system.close()
 
 
 async def main():
     """Main function - run search demo"""
+    setup_logging()
     try:
         await run_unified_search_demo()
     except Exception as e:
-        logger.error(f"Error in main: {e}")
+        logger.error("Error in main: %s", e)
         traceback.print_exc()
 
 
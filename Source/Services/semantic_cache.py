@@ -0,0 +1,153 @@
+"""
+Semantic Cache - results cached by query embedding similarity
+Serves paraphrases of recent queries (same filters) without repeating the
+search / chat calls that produced the cached value
+"""
+
+import copy
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+# Default entries kept, and the cosine similarity at which a new query is
+# considered a paraphrase of a cached one (ada-002 puts questions that differ in a
+# negation or a number around 0.95, so the bar is above that)
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_CACHE_THRESHOLD = 0.97
+
+
+class SemanticCache:
+    """
+    Values cached by query embedding similarity
+
+    A lookup returns the value stored for the most similar cached query with the
+    same filter key, if its cosine similarity reaches the threshold. Vectors are kept
+    unit-normalized in one preallocated matrix, so a lookup is a single mat-vec product.
+    Entries older than ttl seconds (if set) are never returned. When full, an expired
+    entry is replaced first, otherwise the least recently hit one.
+
+    Values that must only answer the very same question (generated answers) are stored and
+    looked up with its normalized text - a near vector is then not enough. Values are copied
+    on the way in and out, so callers can't change a cached entry.
+    """
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self._matrix: Optional[np.ndarray] = None  # (max_entries, dim), allocated on first put
+        self._filter_ids = np.full(max_entries, -1, dtype=np.int64)  # -1 marks an empty/invalidated slot
+        self._last_hit = np.zeros(max_entries, dtype=np.int64)
+        self._stored_at = np.zeros(max_entries, dtype=np.float64)
+        self._values: List[Any] = [None] * max_entries
+        self._texts: List[Optional[str]] = [None] * max_entries
+        # Filter key <-> id, and the number of slots holding each id - an id is dropped with its
+        # last slot, so these stay bounded by max_entries however many distinct keys pass through
+        self._filter_key_ids: Dict[Tuple, int] = {}
+        self._filter_keys: Dict[int, Tuple] = {}
+        self._filter_refs: Dict[int, int] = {}
+        self._next_filter_id = 0
+        self._size = 0
+        self._clock = 0
+
+    @staticmethod
+    def normalize(vector: List[float]) -> np.ndarray:
+        """Unit-normalize an embedding - get() and put() take vectors in this form"""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _acquire_filter_id(self, filter_key: Tuple) -> int:
+        """Id of a filter key (assigned on first use), counting one more slot that holds it"""
+        filter_id = self._filter_key_ids.get(filter_key)
+        if filter_id is None:
+            filter_id = self._filter_key_ids[filter_key] = self._next_filter_id
+            self._filter_keys[filter_id] = filter_key
+            self._next_filter_id += 1
+        self._filter_refs[filter_id] = self._filter_refs.get(filter_id, 0) + 1
+        return filter_id
+
+    def _release_filter_id(self, filter_id: int) -> None:
+        """A slot no longer holds filter_id - forget the key when no slot does"""
+        refs = self._filter_refs[filter_id] - 1
+        if refs:
+            self._filter_refs[filter_id] = refs
+        else:
+            del self._filter_refs[filter_id]
+            del self._filter_key_ids[self._filter_keys.pop(filter_id)]
+
+    def _expired(self) -> np.ndarray:
+        """Mask of used slots whose entries are past their TTL"""
+        if self.ttl is None:
+            return np.zeros(self._size, dtype=bool)
+        return self._stored_at[:self._size] < time.monotonic() - self.ttl
+
+    def get(self, unit_vector: np.ndarray, filter_key: Tuple, text: Optional[str] = None) -> Optional[Any]:
+        """
+        Return a copy of the cached value for a near-identical query with the same filters, or None
+
+        If text is given, the entry must also have been stored with that exact text
+        """
+        filter_id = self._filter_key_ids.get(filter_key)
+        if filter_id is None or not self._size:
+            return None
+
+        similarities = self._matrix[:self._size] @ unit_vector
+        similarities[(self._filter_ids[:self._size] != filter_id) | self._expired()] = -1.0
+
+        best = int(similarities.argmax())
+        if similarities[best] < self.threshold or (text is not None and self._texts[best] != text):
+            return None
+
+        self._clock += 1
+        self._last_hit[best] = self._clock
+        return copy.deepcopy(self._values[best])
+
+    def put(self, unit_vector: np.ndarray, filter_key: Tuple, value: Any, text: Optional[str] = None) -> None:
+        """Store a copy of a value for a (unit-normalized) query embedding, and optionally its text"""
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, unit_vector.shape[0]), dtype=np.float32)
+
+        free = np.flatnonzero((self._filter_ids[:self._size] == -1) | self._expired())
+        if free.size:
+            slot = int(free[0])
+        elif self._size < self.max_entries:
+            slot = self._size
+            self._size += 1
+        else:
+            slot = int(self._last_hit.argmin())
+
+        filter_id = self._acquire_filter_id(filter_key)
+        if self._filter_ids[slot] != -1:
+            self._release_filter_id(int(self._filter_ids[slot]))
+
+        self._clock += 1
+        self._matrix[slot] = unit_vector
+        self._filter_ids[slot] = filter_id
+        self._last_hit[slot] = self._clock
+        self._stored_at[slot] = time.monotonic()
+        self._values[slot] = copy.deepcopy(value)
+        self._texts[slot] = text
+
+    def invalidate(self, predicate: Callable[[Tuple], bool]) -> int:
+        """
+        Drop every entry whose filter key matches predicate (e.g. after re-indexing a course)
+
+        Returns:
+            Number of entries dropped
+        """
+        dropped = 0
+        for filter_key, filter_id in list(self._filter_key_ids.items()):
+            if predicate(filter_key):
+                slots = np.flatnonzero(self._filter_ids[:self._size] == filter_id)
+                self._filter_ids[slots] = -1
+                for slot in slots:
+                    self._values[slot] = None
+                    self._texts[slot] = None
+                dropped += slots.size
+                # Every slot holding the key was just cleared
+                del self._filter_key_ids[filter_key]
+                del self._filter_keys[filter_id]
+                del self._filter_refs[filter_id]
+        return int(dropped)
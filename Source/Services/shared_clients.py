@@ -0,0 +1,102 @@
+"""
+Shared Clients - process-wide network clients
+Keeps one Azure OpenAI client (and its HTTP connection pool) per process so
+keep-alive connections are reused across requests instead of paying a new
+TCP + TLS handshake for every service instance. Also builds the tuned aiohttp
+transports used by the async Azure SDK clients.
+"""
+
+import logging
+import aiohttp
+import httpx
+from azure.core.pipeline.transport import AioHttpTransport
+from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+from Config.config import (
+    AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_VERSION,
+    OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS
+)
+from Config.logging_config import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Connection pool sizing for the shared OpenAI HTTP client. httpx hands out pooled
+# connections to concurrent requests independently, so max_connections is the
+# real concurrency ceiling - tune it (and the idle keep-alive count) from the env
+OPENAI_POOL_LIMITS = httpx.Limits(
+    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    max_connections=OPENAI_MAX_CONNECTIONS,
+    keepalive_expiry=120
+)
+
+# Read/write/pool timeouts stay at the SDK's 10 minutes (long non-streamed completions);
+# connecting fails fast so a dead connection attempt is retried instead of hanging
+OPENAI_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+# Connect attempts the transport retries itself (immediately, before the SDK's own
+# backoff retries) - covers transient DNS / TCP failures when opening pool connections
+OPENAI_CONNECT_RETRIES = 2
+
+_OPENAI_CLIENT = None
+
+
+def build_aiohttp_transport(limit: int, limit_per_host: int, keepalive_timeout: float = 60) -> AioHttpTransport:
+    """
+    Build an aiohttp transport for an async Azure SDK client with its own pool sizing
+
+    The azure-core default pool is small and drops idle connections quickly, so
+    bursts pay fresh TCP + TLS handshakes. Session options mirror the ones
+    azure-core uses for its own sessions (no cookies, SDK-side decompression).
+    Responses are requested gzip-compressed - JSON search results shrink several
+    times over, and gzip is an encoding azure-core's response decoding handles
+    (aiohttp would otherwise also offer br/zstd whenever those packages happen
+    to be installed).
+    Must be called with a running event loop (the aiohttp session binds to it).
+    The transport owns its session - closing the SDK client closes it.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout
+    )
+    session = aiohttp.ClientSession(
+        connector=connector,
+        trust_env=True,
+        cookie_jar=aiohttp.DummyCookieJar(),
+        auto_decompress=False,
+        headers={"Accept-Encoding": "gzip"}
+    )
+    return AioHttpTransport(session=session, session_owner=True)
+
+
+def get_openai_client() -> AsyncAzureOpenAI:
+    """Get the shared Azure OpenAI client, creating it on first use"""
+    global _OPENAI_CLIENT
+    if _OPENAI_CLIENT is None:
+        _OPENAI_CLIENT = AsyncAzureOpenAI(
+            api_key=AZURE_OPENAI_API_KEY,
+            api_version=AZURE_OPENAI_API_VERSION,
+            azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            # SDK default client settings, with an explicit transport: a larger keep-alive
+            # pool, connect retries, and HTTP/2 so concurrent (gathered / streaming) calls
+            # multiplex over a few warm connections - the httpx request log shows the
+            # negotiated version ("HTTP/2 200 OK")
+            http_client=DefaultAsyncHttpxClient(
+                transport=httpx.AsyncHTTPTransport(
+                    http2=True,
+                    limits=OPENAI_POOL_LIMITS,
+                    retries=OPENAI_CONNECT_RETRIES
+                ),
+                timeout=OPENAI_TIMEOUT
+            )
+        )
+        logger.info("Shared Azure OpenAI client created")
+    return _OPENAI_CLIENT
+
+
+async def close_openai_client():
+    """Close the shared Azure OpenAI client - call once on application shutdown"""
+    global _OPENAI_CLIENT
+    if _OPENAI_CLIENT is not None:
+        client, _OPENAI_CLIENT = _OPENAI_CLIENT, None
+        await client.close()
+        logger.info("Shared Azure OpenAI client closed")
@@ -2,21 +2,66 @@
 Assistant Helper - Simple AI assistance for course content
 """
 
+import hashlib
 import logging
 import asyncio
-from typing import Dict, Optional, List
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import AsyncIterator, Deque, Dict, Literal, Optional, List, Sequence, Tuple
+import numpy as np
 from openai import AsyncAzureOpenAI
 from datetime import datetime
 
-from Source.Services.search_on_index import AdvancedUnifiedContentSearch
+from Source.Services.search_on_index import AdvancedUnifiedContentSearch, normalize_query, request_key as make_request_key
 from Source.Services.prompt_loader import get_prompt_loader
-from Config.config import (
-    AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_VERSION,
-    AZURE_OPENAI_CHAT_COMPLETION_MODEL, INDEX_NAME
-)
-from Config.logging_config import setup_logging
+from Source.Services.semantic_cache import SemanticCache
+from Source.Services.shared_clients import get_openai_client
+from Config.config import AZURE_OPENAI_CHAT_COMPLETION_MODEL, INDEX_NAME
+from Config.logging_config import setup_logging, LOGGER_NAME
 
-logger = setup_logging()
+# Shared application logger (handlers are attached once by setup_logging)
+logger = logging.getLogger(LOGGER_NAME)
+
+# Number of most recent messages included in the conversation context
+CONTEXT_HISTORY_MESSAGES = 5
+
+# Max messages kept in the returned conversation history (sliding window)
+MAX_HISTORY = 20
+
+# Seconds a cached response is served to re-asks of the same question
+RESPONSE_CACHE_TTL = 15 * 60
+
+# Exact-query search results cache - max entries and seconds an entry is served
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 15 * 60
+
+# Assistance modes - the API request model validates against this type
+AssistantMode = Literal["lecture", "full_course"]
+
+# mode -> (search filter field for the identifier, number of chunks to retrieve)
+SEARCH_SCOPES: Dict[AssistantMode, Tuple[str, int]] = {
+    "lecture": ("source_id", 5),  # Search in specific source/file
+    "full_course": ("course_id", 8),  # Search in entire course
+}
+
+# Speaker labels for the conversation context (anything but the user is the teacher)
+ROLE_LABELS = {"user": "Student"}
+
+NO_CONTENT_RESPONSE = "לא נמצא תוכן רלוונטי לשאלתך"
+
+# Messages answered with GREETING_RESPONSE - no search, no chat completion
+# (compared after stripping punctuation and casefolding). Thanks are not greetings - they
+# usually come mid-dialogue and go to the model, which continues the conversation
+GREETINGS = frozenset({
+    "שלום", "היי", "הי", "הלו", "אהלן", "בוקר טוב", "ערב טוב",
+    "hi", "hello", "hey",
+})
+GREETING_RESPONSE = "שלום! אני כאן כדי לעזור לך ללמוד. על מה תרצה לשאול?"
+_GREETING_STRIP = " \t\n!?.,:;-"
+
+# Reply to messages with no letters or digits (e.g. "?", "...", emoji)
+EMPTY_QUERY_RESPONSE = "לא הצלחתי להבין את השאלה. אפשר לנסח אותה במילים?"
 
 
 class AssistantHelper:
@@ -30,194 +75,381 @@ class AssistantHelper:
         Initialize Assistant Helper
 
         Args:
-            openai_client: Shared OpenAI client
+            openai_client: Shared OpenAI client (defaults to the process-wide client)
             search_system: Shared search system
             prompt_loader: Shared prompt loader
         """
         # Use provided objects or create fallbacks
-        self.search_system = search_system or AdvancedUnifiedContentSearch(INDEX_NAME)
-        self.openai_client = openai_client or AsyncAzureOpenAI(
-            api_key=AZURE_OPENAI_API_KEY,
-            api_version=AZURE_OPENAI_API_VERSION,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT
-        )
+        self.openai_client = openai_client or get_openai_client()
+        self.search_system = search_system or AdvancedUnifiedContentSearch(INDEX_NAME,
+                                                                           openai_client=self.openai_client)
         self.prompt_loader = prompt_loader or get_prompt_loader()
         self.chat_model = AZURE_OPENAI_CHAT_COMPLETION_MODEL
 
+        # The system message is the same for every request - built once and reused
+        self._system_message = self._build_system_message()
+
+        # (ai_response, sources) by (mode, identifier, context digest), query embedding and normalized
+        # text - a reply continues its dialogue, so it is only reused for the same question in the same context
+        self._response_cache = SemanticCache(ttl=RESPONSE_CACHE_TTL)
+
+        # (mode, identifier, normalized query) -> (stored at, search results), least recently used first
+        self._search_cache: "OrderedDict[Tuple[str, str, str], Tuple[float, List[Dict]]]" = OrderedDict()
+
+        # (request_key(mode, identifier, query), context digest) -> task answering it, while in flight
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def _build_system_message(self) -> Dict[str, str]:
+        return {"role": "system", "content": self.prompt_loader.get_prompt("test_myself", "System")}
+
+    def reload_prompts(self):
+        """Reload the prompt files (after they changed on disk) and rebuild the cached system message"""
+        self.prompt_loader.reload_prompts()
+        self._system_message = self._build_system_message()
+
+    @staticmethod
+    def _history_window(conversation_history: List[Dict]) -> Deque[Dict]:
+        """
+        The last MAX_HISTORY messages of the client's history, in a new deque for this request
+
+        Nothing is kept server-side - a conversation's turns may be served by different worker
+        processes, so the history the client sends is the only record of the conversation
+        """
+        return deque(conversation_history or (), maxlen=MAX_HISTORY)
+
+    def invalidate_cache(self, identifier: str) -> int:
+        """Drop cached responses and search results for a course/source (e.g. after it was re-indexed)"""
+        stale_keys = [cache_key for cache_key in self._search_cache if cache_key[1] == identifier]
+        for cache_key in stale_keys:
+            del self._search_cache[cache_key]
+        return (self._response_cache.invalidate(lambda cache_key: cache_key[1] == identifier) + len(stale_keys)
+                + self.search_system.invalidate_cache(identifier))
+
+    def _get_cached_search(self, cache_key: Tuple[str, str, str]) -> Optional[List[Dict]]:
+        """Search results stored for this exact query in the last SEARCH_CACHE_TTL seconds, or None"""
+        entry = self._search_cache.get(cache_key)
+        if entry is None:
+            return None
+        stored_at, results = entry
+        if time.monotonic() - stored_at > SEARCH_CACHE_TTL:
+            del self._search_cache[cache_key]
+            return None
+        self._search_cache.move_to_end(cache_key)
+        return results
+
+    def _cache_search(self, cache_key: Tuple[str, str, str], results: List[Dict]) -> None:
+        self._search_cache[cache_key] = (time.monotonic(), results)
+        self._search_cache.move_to_end(cache_key)
+        if len(self._search_cache) > SEARCH_CACHE_SIZE:
+            self._search_cache.popitem(last=False)
+
     async def get_help(
             self,
             conversation_id: str,
             conversation_history: List[Dict],
-            mode: str,  # "lecture" or "full_course"
+            mode: AssistantMode,
             identifier: str,  # course_id or source_id
             query: str,  # user question
+            request_key: str = None
     ) -> Dict:
         """
         Get AI assistance with conversation context
 
         Args:
             conversation_id: unique conversation identifier
-            conversation_history: list of previous messages
+            conversation_history: list of previous messages (the client keeps the conversation -
+                send the history returned by the previous turn)
             mode: "lecture" (specific file) or "full_course" (entire course)
             identifier: course_id (for full_course) or source_id (for lecture)
             query: user question
+            request_key: request_key() of (mode, identifier, query), if the caller already
+                computed it (computed here otherwise)
 
         Returns:
             Dict with response and sources
         """
         try:
-            # Search for relevant content based on mode
-            if mode == "lecture":
-                # Search in specific source/file
-                results = await self.search_system.semantic_search(
-                    query=query,
-                    top_k=5,
-                    source_id=identifier
-                )
-            elif mode == "full_course":
-                # Search in entire course
-                results = await self.search_system.semantic_search(
-                    query=query,
-                    top_k=8,
-                    course_id=identifier
-                )
-            else:
-                return {
-                    "conversation_id": conversation_id,
-                    "mode": mode,
-                    "identifier": identifier,
-                    "query": query,
-                    "response": f"מצב לא תקין: {mode}. השתמש ב-'lecture' או 'full_course'",
-                    "sources": [],
-                    "success": False,
-                    "timestamp": datetime.now().isoformat()
-                }
-
-            if not results:
-                return {
-                    "conversation_id": conversation_id,
-                    "mode": mode,
-                    "identifier": identifier,
-                    "query": query,
-                    "response": "לא נמצא תוכן רלוונטי לשאלתך",
-                    "sources": [],
-                    "success": False,
-                    "timestamp": datetime.now().isoformat()
-                }
-
-            # Build context from results
-            context = self._build_context(results)
-
-            # Build conversation context
-            conversation_context = self._build_conversation_context(conversation_history)
-
-            # Get prompts using injected prompt_loader
-            system_prompt = self.prompt_loader.get_prompt("test_myself", "System")
-            user_prompt = self.prompt_loader.get_prompt(
-                "test_myself",
-                "User",
-                conversation_context=conversation_context,
-                context=context,
-                query=query
+            history = self._history_window(conversation_history)
+
+            # Identical questions asked at the same time with the same recent context share one
+            # search + completion (the prompt includes that context)
+            inflight_key = (
+                request_key or make_request_key(mode, identifier, query), self._context_digest(history)
             )
+            answer_task = self._inflight.get(inflight_key)
+            if answer_task is None:
+                answer_task = asyncio.create_task(self._answer(conversation_id, history, mode, identifier, query))
+                self._inflight[inflight_key] = answer_task
+                answer_task.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+            # Shielded - a disconnecting caller must not cancel the answer the others wait for
+            answer = await asyncio.shield(answer_task)
+
+            if answer is None:
+                return self._error_result(conversation_id, history, mode, identifier, query, NO_CONTENT_RESPONSE)
+
+            ai_response, sources = answer
+            return self._build_result(conversation_id, history, mode, identifier, query, ai_response, sources)
+
+        except Exception as e:
+            logger.error(f"Error in assistant helper: {e}")
+            return self._error_result(conversation_id, conversation_history, mode, identifier, query,
+                                      f"שגיאה: {str(e)}", error=str(e))
+
+    async def _answer(self, conversation_id: str, history: Deque[Dict], mode: str, identifier: str,
+                      query: str) -> Optional[Tuple[str, List[Dict]]]:
+        """Get (ai_response, sources) from the cache or a search + chat completion - None if nothing was found"""
+        cached, messages, sources, unit_vector = await self._prepare_help(
+            conversation_id, history, mode, identifier, query
+        )
+
+        if cached is not None:
+            return cached
+        if messages is None:
+            return None
+
+        # Get AI response
+        response = await self.openai_client.chat.completions.create(
+            model=self.chat_model,
+            messages=messages,
+            max_tokens=8000,
+            temperature=0.4
+        )
+        ai_response = response.choices[0].message.content.strip()
+        self._cache_response(unit_vector, mode, identifier, history, query, ai_response, sources)
+        return ai_response, sources
+
+    async def stream_help(
+            self,
+            conversation_id: str,
+            conversation_history: List[Dict],
+            mode: AssistantMode,
+            identifier: str,
+            query: str,
+    ) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of get_help
 
-            # Get AI response
-            response = await self.openai_client.chat.completions.create(
-                model=self.chat_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": user_prompt
-                    }
-                ],
-                max_tokens=8000,
-                temperature=0.4
+        Same search, cache and prompts as get_help, but the completion is requested with
+        stream=True so the first tokens reach the caller without waiting for the full answer.
+        The collected answer is added to the conversation history once the stream ends
+
+        Yields:
+            {"event": "delta", "data": response text} for every piece of the response, then a
+            single {"event": "done", "data": result dict} (same shape as get_help's result)
+        """
+        try:
+            history = self._history_window(conversation_history)
+            cached, messages, sources, unit_vector = await self._prepare_help(
+                conversation_id, history, mode, identifier, query
             )
 
-            ai_response = response.choices[0].message.content.strip()
+            if cached is not None:
+                ai_response, sources = cached
+                yield {"event": "delta", "data": ai_response}
+            elif messages is None:
+                result = self._error_result(conversation_id, history, mode, identifier, query, NO_CONTENT_RESPONSE)
+                yield {"event": "delta", "data": result["response"]}
+                yield {"event": "done", "data": result}
+                return
+            else:
+                stream = await self.openai_client.chat.completions.create(
+                    model=self.chat_model,
+                    messages=messages,
+                    max_tokens=8000,
+                    temperature=0.4,
+                    stream=True
+                )
 
-            # Format sources
-            sources = []
-            for i, result in enumerate(results, 1):
-                sources.append({
-                    "index": i,
-                    "source_id": result.get('source_id', ''),
-                    "content_type": result.get('content_type', ''),
-                    "score": result.get('@search.score', 0),
-                    "preview": result.get('text', '')[:150] + "..."
-                })
+                response_parts = []
+                async for chunk in stream:
+                    # Azure may send chunks without choices (e.g. content filter results)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        delta = chunk.choices[0].delta.content
+                        response_parts.append(delta)
+                        yield {"event": "delta", "data": delta}
 
-            # Build updated conversation history with timestamps
-            updated_conversation_history = conversation_history.copy() if conversation_history else []
+                ai_response = "".join(response_parts).strip()
+                self._cache_response(unit_vector, mode, identifier, history, query, ai_response, sources)
 
-            # Add user query to history
-            updated_conversation_history.append({
-                "role": "user",
-                "content": query,
-                "timestamp": datetime.now().isoformat()
-            })
-
-            # Add assistant response to history
-            updated_conversation_history.append({
-                "role": "assistant",
-                "content": ai_response,
-                "timestamp": datetime.now().isoformat()
-            })
-
-            return {
-                "conversation_id": conversation_id,
-                "conversation_history": updated_conversation_history,
-                "mode": mode,
-                "identifier": identifier,
-                "query": query,
-                "response": ai_response,
-                "sources": sources,
-                "success": True,
-                "timestamp": datetime.now().isoformat()
-            }
+            yield {"event": "done", "data": self._build_result(
+                conversation_id, history, mode, identifier, query, ai_response, sources
+            )}
 
         except Exception as e:
-            logger.error(f"Error in assistant helper: {e}")
-            return {
-                "conversation_id": conversation_id,
-                "mode": mode,
-                "identifier": identifier,
-                "query": query,
-                "response": f"שגיאה: {str(e)}",
-                "sources": [],
-                "success": False,
-                "error": str(e),
-                "timestamp": datetime.now().isoformat()
+            logger.error(f"Error in streaming assistant helper: {e}")
+            yield {"event": "done", "data": self._error_result(
+                conversation_id, conversation_history, mode, identifier, query, f"שגיאה: {str(e)}", error=str(e)
+            )}
+
+    async def _prepare_help(
+            self,
+            conversation_id: str,
+            conversation_history: Deque[Dict],
+            mode: AssistantMode,
+            identifier: str,
+            query: str
+    ) -> Tuple[Optional[Tuple[str, List[Dict]]], Optional[List[Dict]], List[Dict], Optional[np.ndarray]]:
+        """
+        Serve a cached response, or search and build the chat messages
+
+        Returns:
+            Tuple of (cached, messages, sources, unit_vector):
+            cached is (ai_response, sources) on a response cache hit, a greeting or an empty
+            message, otherwise None;
+            messages is None when there was a cache hit or the search found nothing;
+            unit_vector is the normalized query embedding for _cache_response (None if embedding failed)
+        """
+        # Greetings and messages without text get a canned reply - nothing to search for
+        normalized_query = query.strip(_GREETING_STRIP).casefold()
+        if not any(char.isalnum() for char in normalized_query):
+            return (EMPTY_QUERY_RESPONSE, []), None, [], None
+        if normalized_query in GREETINGS:
+            return (GREETING_RESPONSE, []), None, [], None
+
+        # A re-ask of a recent question in the same scope and context reuses its answer -
+        # no search and no chat completion. The embedding is reused by the search
+        query_vector = await self.search_system.generate_query_embedding(query)
+        unit_vector = self._response_cache.normalize(query_vector) if query_vector else None
+        if unit_vector is not None:
+            cached = self._response_cache.get(
+                unit_vector, (mode, identifier, self._context_digest(conversation_history)), normalize_query(query)
+            )
+            if cached is not None:
+                logger.info("Response cache hit")
+                return cached, None, [], unit_vector
+
+        # An exact re-ask (e.g. after its cached response expired or when embedding failed)
+        # reuses the search results - the search is deterministic for the same query
+        search_key = (mode, identifier, normalize_query(query))
+        results = self._get_cached_search(search_key)
+        if results is None:
+            scope_field, top_k = SEARCH_SCOPES[mode]
+            results = await self.search_system.semantic_search(
+                query=query,
+                top_k=top_k,
+                query_vector=query_vector,
+                session_id=conversation_id,
+                **{scope_field: identifier}
+            )
+            if results:
+                self._cache_search(search_key, results)
+
+        if not results:
+            return None, None, [], unit_vector
+
+        # Build context from results and the recent conversation
+        context = self._build_context(results)
+        conversation_context = self._build_conversation_context(conversation_history)
+
+        # Get user prompt using injected prompt_loader
+        user_prompt = self.prompt_loader.get_prompt(
+            "test_myself",
+            "User",
+            conversation_context=conversation_context,
+            context=context,
+            query=query
+        )
+
+        messages = [
+            self._system_message,
+            {
+                "role": "user",
+                "content": user_prompt
             }
+        ]
+
+        # Format sources
+        sources = [
+            {
+                "index": i,
+                "source_id": result.get('source_id', ''),
+                "content_type": result.get('content_type', ''),
+                "score": result.get('@search.score', 0),
+                "preview": result.get('text', '')[:150] + "..."
+            }
+            for i, result in enumerate(results, 1)
+        ]
+
+        return None, messages, sources, unit_vector
+
+    def _cache_response(self, unit_vector: Optional[np.ndarray], mode: str, identifier: str,
+                        conversation_history: Deque[Dict], query: str, ai_response: str, sources: List[Dict]) -> None:
+        """Store a generated response for re-asks of the same question in the same context"""
+        if unit_vector is not None:
+            self._response_cache.put(
+                unit_vector, (mode, identifier, self._context_digest(conversation_history)), (ai_response, sources),
+                normalize_query(query)
+            )
+
+    @staticmethod
+    def _build_result(conversation_id: str, history: Deque[Dict], mode: str, identifier: str,
+                      query: str, ai_response: str, sources: List[Dict]) -> Dict:
+        """Build a successful get_help result, appending the new exchange to the conversation's history"""
+        # The history deque is bounded (maxlen MAX_HISTORY) - appending drops the oldest messages
+        timestamp = datetime.now().isoformat()
+        history.extend((
+            {"role": "user", "content": query, "timestamp": timestamp},
+            {"role": "assistant", "content": ai_response, "timestamp": timestamp}
+        ))
+
+        return {
+            "conversation_id": conversation_id,
+            "conversation_history": list(history),
+            "mode": mode,
+            "identifier": identifier,
+            "query": query,
+            "response": ai_response,
+            "sources": sources,
+            "success": True,
+            "timestamp": timestamp
+        }
+
+    @staticmethod
+    def _error_result(conversation_id: str, conversation_history: Sequence[Dict], mode: str, identifier: str,
+                      query: str, response: str, error: str = None) -> Dict:
+        """Build an unsuccessful get_help result - the history is returned without the failed exchange"""
+        result = {
+            "conversation_id": conversation_id,
+            "conversation_history": list(conversation_history or ()),
+            "mode": mode,
+            "identifier": identifier,
+            "query": query,
+            "response": response,
+            "sources": [],
+            "success": False,
+            "timestamp": datetime.now().isoformat()
+        }
+        if error is not None:
+            result["error"] = error
+        return result
 
     def _build_context(self, results):
         """Build simple context from search results"""
-        context_parts = []
-        for i, result in enumerate(results, 1):
-            text = result.get('text', '')
-            context_parts.append(f"Source {i}: {text}")
-        return "\n\n".join(context_parts)
+        return "\n\n".join(f"Source {i}: {result.get('text', '')}" for i, result in enumerate(results, 1))
+
+    @staticmethod
+    def _context_digest(conversation_history: Deque[Dict]) -> str:
+        """Digest of the messages _build_conversation_context includes - equal digests give the same prompt"""
+        digest = hashlib.blake2b(digest_size=16)
+        for msg in islice(conversation_history, max(len(conversation_history) - CONTEXT_HISTORY_MESSAGES, 0), None):
+            digest.update(f"{msg.get('role')}\x1f{msg.get('content')}\x1e".encode())
+        return digest.hexdigest()
 
     def _build_conversation_context(self, conversation_history):
         """Build conversation context from history"""
         if not conversation_history:
             return "This is the beginning of the conversation."
 
-        context_parts = ["Previous conversation context:"]
-        for msg in conversation_history[-5:]:  # Last 5 messages for context
-            role = "Student" if msg.get('role') == 'user' else "Teacher"
-            content = msg.get('content', '')
-            context_parts.append(f"{role}: {content}")
-
-        return "\n".join(context_parts)
+        # Last N messages for context - one join, no intermediate list
+        return "Previous conversation context:\n" + "\n".join(
+            f"{ROLE_LABELS.get(msg.get('role'), 'Teacher')}: {msg.get('content', '')}"
+            for msg in islice(conversation_history, max(len(conversation_history) - CONTEXT_HISTORY_MESSAGES, 0), None)
+        )
 
 
 async def main():
     """Demo"""
+    setup_logging()
     assistant = AssistantHelper()
 
     # Test lecture mode
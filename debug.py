@@ -10,19 +10,20 @@ async def debug_index_fields():
     """Debug function to check what fields exist in the index"""
     print("Debugging index fields...")
 
+    search = None
     try:
         # Create search instance
         search = AdvancedUnifiedContentSearch()
 
         # Get a sample document with all fields
         print("\nGetting sample document with all fields...")
-        results = search.search_client.search(
+        results = await search.search_client.search(
             search_text="*",
             select=["*"],  # Select all fields
             top=1
         )
 
-        docs = list(results)
+        docs = [doc async for doc in results]
         if docs:
             sample_doc = docs[0]
             print(f"\nFound sample document with ID: {sample_doc.get('id', 'N/A')}")
@@ -59,6 +60,9 @@ async def debug_index_fields():
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        if search is not None:
+            await search.close()
 
 
 if __name__ == "__main__":
@@ -11,16 +11,31 @@ Required old_config.py settings:
 - SEARCH_SERVICE_NAME
 """
 
+import asyncio
+import os
+from uuid import uuid4
+
+# One BLAS/OpenMP thread per process - must be set before numpy is first imported (via the
+# services below). numpy only does small cache mat-vecs here, and with several uvicorn
+# workers per host, default per-core thread pools in each would just oversubscribe the CPUs
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import orjson
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 import uvicorn
 from contextlib import asynccontextmanager
-from Config.logging_config import setup_logging
+from Config.logging_config import setup_logging, request_id_var
 from Source.Services.free_chat import RAGSystem
-from Source.Services.test_myself import AssistantHelper
-from Source.Services.prompt_loader import initialize_prompt_loader
+from Source.Services.test_myself import AssistantHelper, AssistantMode
+from Source.Services.prompt_loader import initialize_prompt_loader_async
+from Source.Services.search_on_index import request_key
+from Source.Services.shared_clients import get_openai_client, close_openai_client
 
 # Initialize logger
 logger = setup_logging()
@@ -32,6 +47,42 @@ def debug_log(message):
     logger.debug(message)
 
 
+# Streaming responses must reach the client event by event - no caching, and no
+# buffering by reverse proxies in front of the app (nginx honours X-Accel-Buffering)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class RequestIdMiddleware:
+    """
+    Give every HTTP request its own correlation ID - the caller's X-Request-ID header if sent,
+    otherwise a fresh one. It is stamped on the request's log records (via request_id_var)
+    and echoed in the X-Request-ID response header
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        header_id = next((value for name, value in scope["headers"] if name == b"x-request-id"), b"")
+        request_id = header_id.decode("latin-1")[:64] or uuid4().hex
+        request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
+
+
+def sse_event(event: str, payload: Any) -> bytes:
+    """Encode one server-sent event - orjson writes the Hebrew text as raw UTF-8, no escaping"""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(payload) + b"\n\n"
+
+
 # ================================
 # SERVICE GETTERS - Get services from app.state (initialized in lifespan)
 # ================================
@@ -84,23 +135,24 @@ async def lifespan(app: FastAPI):
     # STARTUP - Application initialization
     logger.info("App is starting - Initializing services...")
 
+    # Every service call is async, so nothing should hold the event loop for long. In
+    # development, have asyncio log any callback that blocks it for more than 50 ms
+    if os.getenv("DEV") == "1":
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = 0.05
+
     try:
         # Initialize and preload all prompts at startup FIRST
         logger.info("Initializing and preloading all prompts...")
-        prompt_loader = initialize_prompt_loader()
+        prompt_loader = await initialize_prompt_loader_async()
         app.state.prompt_loader = prompt_loader
         logger.info("All prompts preloaded successfully")
 
-        # Initialize shared OpenAI client
+        # Initialize shared OpenAI client - the process-wide client (one pooled HTTP/2
+        # transport) injected into every service below
         logger.info("Initializing shared OpenAI client...")
-        from openai import AsyncAzureOpenAI
-        from Config.config import AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_VERSION
-
-        shared_openai_client = AsyncAzureOpenAI(
-            api_key=AZURE_OPENAI_API_KEY,
-            api_version=AZURE_OPENAI_API_VERSION,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT
-        )
+        shared_openai_client = get_openai_client()
         app.state.shared_openai_client = shared_openai_client
         logger.info("Shared OpenAI client initialized successfully")
 
@@ -109,7 +161,7 @@ async def lifespan(app: FastAPI):
         from Source.Services.search_on_index import AdvancedUnifiedContentSearch
         from Config.config import INDEX_NAME
 
-        shared_search_system = AdvancedUnifiedContentSearch(INDEX_NAME)
+        shared_search_system = AdvancedUnifiedContentSearch(INDEX_NAME, openai_client=shared_openai_client)
         app.state.shared_search_system = shared_search_system
         logger.info("Shared search system initialized successfully")
 
@@ -142,10 +194,14 @@ async def lifespan(app: FastAPI):
         app.state.assistant_helper = assistant_helper
         logger.info("Assistant Helper initialized successfully")
 
+        # Open the search and OpenAI connections now, so the first request doesn't pay
+        # the TLS handshakes (the services share both clients, so once covers all)
+        await shared_search_system.warmup()
+
         logger.info("All services initialized successfully - Application ready!")
 
     except Exception as e:
-        logger.error(f"Failed to initialize services: {e}")
+        logger.error("Failed to initialize services: %s", e)
         raise
 
     # Application is running
@@ -155,52 +211,41 @@ async def lifespan(app: FastAPI):
     logger.info("App is shutting down - Cleaning up resources...")
 
     try:
-        # Close shared OpenAI client (used by both RAG and Assistant Helper)
+        # Stop the RAG system's background tasks first - they use the shared clients
+        if hasattr(app.state, "rag_system"):
+            await app.state.rag_system.close()
+
+        # Close the shared OpenAI client once - RAG, Assistant Helper and search all use it
         if hasattr(app.state, "shared_openai_client"):
             try:
-                await app.state.shared_openai_client.close()
-                logger.info("Shared OpenAI client closed")
+                await close_openai_client()
             except Exception as e:
-                logger.warning(f"Error closing shared OpenAI client: {e}")
+                logger.warning("Error closing shared OpenAI client: %s", e)
 
         # Close shared search system resources
         if hasattr(app.state, "shared_search_system"):
-            search_system = app.state.shared_search_system
             logger.info("Closing shared search system resources...")
 
-            # Close search system OpenAI client
-            if hasattr(search_system, 'openai_client') and search_system.openai_client:
-                try:
-                    await search_system.openai_client.close()
-                    logger.info("Search system OpenAI client closed")
-                except Exception as e:
-                    logger.warning(f"Error closing Search system OpenAI client: {e}")
-
-            # Close Azure Search client
-            search_client = getattr(search_system, 'search_client', None)
-            if search_client and hasattr(search_client, 'close'):
-                try:
-                    search_client.close()
-                    logger.info("Azure Search client closed")
-                except Exception as e:
-                    logger.warning(f"Error closing Azure Search client: {e}")
+            # Close Azure Search client (async client - must be awaited)
+            try:
+                await app.state.shared_search_system.close()
+            except Exception as e:
+                logger.warning("Error closing Azure Search client: %s", e)
 
         # Close shared blob manager resources
         if hasattr(app.state, "shared_blob_manager"):
-            blob_manager = app.state.shared_blob_manager
             logger.info("Closing shared blob manager resources...")
 
-            if hasattr(blob_manager, '_async_client') and blob_manager._async_client:
-                try:
-                    await blob_manager._async_client.close()
-                    logger.info("Shared blob manager client closed")
-                except Exception as e:
-                    logger.warning(f"Error closing shared blob manager: {e}")
+            try:
+                await app.state.shared_blob_manager.close()
+                logger.info("Shared blob manager client closed")
+            except Exception as e:
+                logger.warning("Error closing shared blob manager: %s", e)
 
         logger.info("All shared resources cleaned up successfully")
 
     except Exception as e:
-        logger.error(f"Error during cleanup: {e}")
+        logger.error("Error during cleanup: %s", e)
 
     logger.info("Application shutdown completed")
 
@@ -209,7 +254,9 @@ async def lifespan(app: FastAPI):
 app = FastAPI(
     title="Chat Service API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson encodes the (Hebrew-heavy) conversation_history payloads much faster than json
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -221,6 +268,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Hebrew answers and sources lists compress several times over. Starlette skips
+# text/event-stream responses, so the streaming endpoints still flush every event
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
+
+# Outermost, so everything logged while handling a request carries its ID
+app.add_middleware(RequestIdMiddleware)
+
 
 # ================================
 # RESPONSE MODELS
@@ -230,12 +284,13 @@ class ErrorResponse(BaseModel):
     detail: str
 
 
+# Required string fields must be non-empty - pydantic rejects the request (422) before the endpoint runs
 class FreeChatRequest(BaseModel):
-    conversation_id: str
+    conversation_id: str = Field(min_length=1)
     conversation_history: List[Dict[str, Any]]
-    course_id: str
-    user_message: str
-    stage: str
+    course_id: str = Field(min_length=1)
+    user_message: str = Field(min_length=1)
+    stage: str = Field(min_length=1)
     source_id: Optional[str] = None
     subject_type: Optional[str] = None
     course_name: Optional[str] = None
@@ -251,14 +306,15 @@ class FreeChatResponse(BaseModel):
     sources: List[Dict[str, Any]]
     timestamp: str
     success: bool
+    error: Optional[str] = None
 
 
 class AssistantRequest(BaseModel):
-    conversation_id: str
+    conversation_id: str = Field(min_length=1)
     conversation_history: List[Dict[str, Any]]
-    mode: str  # "lecture" or "full_course"
-    identifier: str  # course_id or source_id
-    query: str  # user question
+    mode: AssistantMode
+    identifier: str = Field(min_length=1)  # course_id or source_id
+    query: str = Field(min_length=1)  # user question
 
 
 class AssistantResponse(BaseModel):
@@ -271,6 +327,7 @@ class AssistantResponse(BaseModel):
     sources: List[Dict[str, Any]]
     success: bool
     timestamp: str
+    error: Optional[str] = None
 
 
 # ================================
@@ -286,7 +343,9 @@ async def root():
         "status": "Active",
         "functions": [
             "/free-chat - RAG-based conversational AI",
+            "/free-chat/stream - RAG-based conversational AI (streamed as server-sent events)",
             "/test_myself - AI tutor for self-assessment and guided learning",
+            "/test_myself/stream - AI tutor for self-assessment (streamed as server-sent events)",
             "/search - Advanced content search",
             "/index/status - Check index status"
         ],
@@ -307,8 +366,8 @@ async def health_check():
 @app.post(
     "/free-chat",
     response_model=FreeChatResponse,
+    response_class=ORJSONResponse,
     responses={
-        400: {"model": ErrorResponse, "description": "Invalid request data"},
         500: {"model": ErrorResponse, "description": "Free chat failed"}
     },
     tags=["Free Chat"]
@@ -335,7 +394,7 @@ async def free_chat_endpoint(request: FreeChatRequest):
           "conversation_history": [
             {
               "role": "user",
-              "content": "User query: מה זה לוגיקה?\\n\\nRelevant context:\\nSource 1: לוגיקה היא תחום במתמטיקה העוסק בחוקי החשיבה הנכונה",
+              "content": "מה זה לוגיקה?",
               "timestamp": "2025-01-14T08:45:00.123456"
             },
             {
@@ -365,24 +424,17 @@ async def free_chat_endpoint(request: FreeChatRequest):
 
     **Returns:**
     - All input fields preserved
-    - **conversation_history**: Updated conversation history including new exchange with context chunks
+    - **conversation_history**: Updated conversation history including the new exchange (user message without retrieved context)
     - **final_answer**: RAG-based response in Hebrew
     - **sources**: Detailed information about sources used
     - **timestamp**: Response generation time
     - **success**: Boolean indicating operation success
     """
     try:
-        logger.info(f"Free chat request: {request.user_message} (course: {request.course_id})")
-
-        # Validate required fields
-        if not request.conversation_id:
-            raise HTTPException(status_code=400, detail="conversation_id is required")
-        if not request.course_id:
-            raise HTTPException(status_code=400, detail="course_id is required")
-        if not request.user_message:
-            raise HTTPException(status_code=400, detail="user_message is required")
-        if not request.stage:
-            raise HTTPException(status_code=400, detail="stage is required")
+        # Log records carry the request ID (RequestIdMiddleware) - the (possibly personal)
+        # question text itself is not logged
+        logger.info("Free chat request (course: %s, stage: %s, %d chars)",
+                    request.course_id, request.stage, len(request.user_message))
 
         # Get RAG system using getter function
         rag_system = get_rag_system()
@@ -394,35 +446,73 @@ async def free_chat_endpoint(request: FreeChatRequest):
             stage=request.stage,
             source_id=request.source_id,
             subject_type=request.subject_type,
-            course_name=request.course_name
+            course_name=request.course_name,
+            request_key=request_key(request.course_id, request.stage, request.source_id, request.user_message)
         )
 
         # Log result
-        if result['success']:
-            logger.info(f"Generated answer for: {request.user_message}")
+        if result.success:
+            logger.info("Generated answer")
         else:
-            logger.warning(f"Failed to generate answer: {result.get('error', 'Unknown error')}")
-
-        # Return complete response with updated conversation_history
-        return FreeChatResponse(
-            conversation_id=result['conversation_id'],
-            conversation_history=result['conversation_history'],
-            course_id=result['course_id'],
-            user_message=result['user_message'],
-            stage=result['stage'],
-            final_answer=result['final_answer'],
-            sources=result['sources'],
-            timestamp=result['timestamp'],
-            success=result['success']
-        )
+            logger.warning("Failed to generate answer: %s", result.error or 'Unknown error')
+
+        # Return complete response with updated conversation_history. The RAGResponse dataclass
+        # has the FreeChatResponse fields and orjson serializes it as-is - returning a response
+        # object skips building and re-serializing a pydantic model (requests are still validated)
+        return ORJSONResponse(result)
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in free chat endpoint: {e}")
+        logger.error("Error in free chat endpoint: %s", e)
         raise HTTPException(status_code=500, detail=f"Free chat failed: {str(e)}")
 
 
+@app.post(
+    "/free-chat/stream",
+    responses={
+        500: {"model": ErrorResponse, "description": "Free chat failed"}
+    },
+    tags=["Free Chat"]
+)
+async def free_chat_stream_endpoint(request: FreeChatRequest):
+    """
+    Free Chat with RAG-based Responses - streamed
+
+    **Function Description:**
+    Same request body as `/free-chat`, but the answer is streamed as server-sent events
+    while the model generates it, so the first words arrive without waiting for the
+    complete answer.
+
+    **Events:**
+    - **delta**: `{"content": "..."}` - the next piece of the answer
+    - **done**: the complete `/free-chat` response (updated conversation_history, sources,
+      final_answer, timestamp, success) - sent once, after the last delta
+    """
+    logger.info("Free chat stream request (course: %s, stage: %s, %d chars)",
+                request.course_id, request.stage, len(request.user_message))
+
+    # Get RAG system using getter function
+    rag_system = get_rag_system()
+
+    async def event_stream():
+        async for event in rag_system.generate_answer_stream(
+            conversation_id=request.conversation_id,
+            conversation_history=request.conversation_history,
+            course_id=request.course_id,
+            user_message=request.user_message,
+            stage=request.stage,
+            source_id=request.source_id,
+            subject_type=request.subject_type,
+            course_name=request.course_name
+        ):
+            # The done event carries the RAGResponse dataclass - orjson serializes it natively
+            payload = {"content": event["data"]} if event["event"] == "delta" else event["data"]
+            yield sse_event(event["event"], payload)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 # ================================
 # ASSISTANT HELPER ENDPOINTS
 # ================================
@@ -430,8 +520,8 @@ async def free_chat_endpoint(request: FreeChatRequest):
 @app.post(
     "/test_myself",
     response_model=AssistantResponse,
+    response_class=ORJSONResponse,
     responses={
-        400: {"model": ErrorResponse, "description": "Invalid request data"},
         500: {"model": ErrorResponse, "description": "Test myself failed"}
     },
     tags=["Test Myself"]
@@ -471,6 +561,8 @@ async def test_myself_endpoint(request: AssistantRequest):
     - **conversation_id**: Unique identifier for the conversation session
     - **conversation_history**: List of previous messages in the conversation for context
         - Each message contains: role ("user"/"assistant"), content (message text), and timestamp
+        - Required on every turn (empty on the first) - the server keeps no history, so send
+          the conversation_history returned by the previous turn
     - **mode**: "lecture" (specific file/source) or "full_course" (entire course)
     - **identifier**: source_id (for lecture mode) or course_id (for full_course mode)
     - **query**: Student's current question or request for help
@@ -486,21 +578,8 @@ async def test_myself_endpoint(request: AssistantRequest):
     - **timestamp**: Response generation time
     """
     try:
-        logger.info(f"Assistant help request: {request.query} (mode: {request.mode}, id: {request.identifier})")
-
-        # Validate required fields
-        if not request.conversation_id:
-            raise HTTPException(status_code=400, detail="conversation_id is required")
-        if not request.mode:
-            raise HTTPException(status_code=400, detail="mode is required")
-        if not request.identifier:
-            raise HTTPException(status_code=400, detail="identifier is required")
-        if not request.query:
-            raise HTTPException(status_code=400, detail="query is required")
-
-        # Validate mode
-        if request.mode not in ["lecture", "full_course"]:
-            raise HTTPException(status_code=400, detail="mode must be 'lecture' or 'full_course'")
+        logger.info("Assistant help request (mode: %s, id: %s, %d chars)",
+                    request.mode, request.identifier, len(request.query))
 
         # Get assistant helper using getter function
         assistant_helper = get_assistant_helper()
@@ -509,49 +588,100 @@ async def test_myself_endpoint(request: AssistantRequest):
             conversation_history=request.conversation_history,
             mode=request.mode,
             identifier=request.identifier,
-            query=request.query
+            query=request.query,
+            request_key=request_key(request.mode, request.identifier, request.query)
         )
 
         # Log result
         if result['success']:
-            logger.info(f"Generated assistant help for: {request.query}")
+            logger.info("Generated assistant help")
         else:
-            logger.warning(f"Failed to generate assistant help: {result.get('error', 'Unknown error')}")
-
-        # Return response
-        return AssistantResponse(
-            conversation_id=result['conversation_id'],
-            conversation_history=result['conversation_history'],
-            mode=result['mode'],
-            identifier=result['identifier'],
-            query=result['query'],
-            response=result['response'],
-            sources=result['sources'],
-            success=result['success'],
-            timestamp=result['timestamp']
-        )
+            logger.warning("Failed to generate assistant help: %s", result.get('error', 'Unknown error'))
+
+        # Return the result dict as-is (same fields as AssistantResponse), skipping the pydantic model
+        return ORJSONResponse(result)
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in assistant help endpoint: {e}")
+        logger.error("Error in assistant help endpoint: %s", e)
         raise HTTPException(status_code=500, detail=f"Assistant help failed: {str(e)}")
 
 
+@app.post(
+    "/test_myself/stream",
+    responses={
+        500: {"model": ErrorResponse, "description": "Test myself failed"}
+    },
+    tags=["Test Myself"]
+)
+async def test_myself_stream_endpoint(request: AssistantRequest):
+    """
+    Test Myself - streamed
+
+    **Function Description:**
+    Same request body as `/test_myself`, but the tutor's response is streamed as server-sent
+    events while the model generates it, so the first words arrive without waiting for the
+    complete response.
+
+    **Events:**
+    - **delta**: `{"content": "..."}` - the next piece of the response
+    - **done**: the complete `/test_myself` response (updated conversation_history, sources,
+      response, timestamp, success) - sent once, after the last delta
+    """
+    logger.info("Assistant help stream request (mode: %s, id: %s, %d chars)",
+                request.mode, request.identifier, len(request.query))
+
+    # Get assistant helper using getter function
+    assistant_helper = get_assistant_helper()
+
+    async def event_stream():
+        async for event in assistant_helper.stream_help(
+            conversation_id=request.conversation_id,
+            conversation_history=request.conversation_history,
+            mode=request.mode,
+            identifier=request.identifier,
+            query=request.query
+        ):
+            payload = {"content": event["data"]} if event["event"] == "delta" else event["data"]
+            yield sse_event(event["event"], payload)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 # ================================
 # SERVER STARTUP
 # ================================
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the FreeChat API server")
+    parser.add_argument("--reload", action="store_true", default=os.getenv("DEV") == "1",
+                        help="Development mode: single worker on localhost, restart on code changes "
+                             "(default on when DEV=1)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+                        help="Worker processes (default: WEB_CONCURRENCY, else CPU count; ignored with --reload)")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    host = "localhost" if args.reload else "0.0.0.0"
+
     logger.info("Starting FastAPI server...")
-    logger.info("API documentation available at: http://localhost:8080/docs")
-    logger.info("Home page: http://localhost:8080/")
+    logger.info("API documentation available at: http://localhost:%s/docs", args.port)
+    logger.info("Home page: http://localhost:%s/", args.port)
     logger.info("Stop server: Ctrl+C")
 
+    # Each worker is a separate process running its own lifespan, so it owns its
+    # own service instances and connection pools. "auto" picks uvloop and httptools
+    # when installed (they are on Linux; uvloop has no Windows build) and falls back
+    # to asyncio / h11 otherwise
     uvicorn.run(
         "main:app",
-        host="localhost",
-        port=8080,
+        host=host,
+        port=args.port,
         log_level="info",
-        reload=True
+        reload=args.reload,
+        workers=None if args.reload else args.workers,
+        loop="auto",
+        http="auto"
     )